@@ -0,0 +1,245 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import auth
+
+"""
+audit_passwords.py
+
+Offline audit: find stored password hashes that match a breached-password
+list (one candidate per line).
+
+Every (user, candidate) pair costs one full KDF verification, so the work is
+cut into units of about --unit-pairs pairs (a slice of candidates against a
+block of users) and spread over a process pool. The candidate list is
+streamed: only the units in flight are held in memory, however long the
+list is. A user is dropped from later units once a match is found.
+
+Findings are appended to the report as they arrive (username, hash backend,
+line number of the matching candidate; plaintext is not written). Progress is
+checkpointed as the byte offset of the last candidate line whose units have
+all finished, so an interrupted audit resumes from there. Users already in
+the report are not re-checked.
+
+Usage:
+    python audit_passwords.py breached.txt
+    python audit_passwords.py breached.txt --workers 8 --report audit_report.csv
+"""
+
+DEFAULT_REPORT = "audit_report.csv"
+DEFAULT_CHECKPOINT = "audit_checkpoint.json"
+DEFAULT_UNIT_PAIRS = 64
+CHECKPOINT_EVERY_S = 5.0
+PROGRESS_EVERY_S = 10.0
+
+
+def _check_unit(users, candidates):
+    # users: [(username, hash)], candidates: [(line_no, password)]
+    found = []
+    for username, hashed in users:
+        for line_no, password in candidates:
+            if auth.verify_password(password, hashed):
+                found.append((username, line_no))
+                break
+    return found
+
+
+def _backend_name(hashed):
+    if auth.is_wrapped(hashed):
+        return "wrapped"
+    kdf = auth.identify_kdf(hashed)
+    return kdf.name if kdf else "unknown"
+
+
+def read_candidates(path, offset=0, line_no=0):
+    """Yield (line_no, end_offset, password) from `offset`, skipping blank lines."""
+    with open(path, "rb") as fh:
+        fh.seek(offset)
+        for raw in iter(fh.readline, b""):
+            line_no += 1
+            password = raw.rstrip(b"\r\n").decode("utf-8", errors="replace")
+            if password:
+                yield line_no, fh.tell(), password
+
+
+def _users_fingerprint(users):
+    digest = hashlib.sha256()
+    for username, hashed in users:
+        digest.update(f"{username},{hashed}\n".encode("utf-8"))
+    return digest.hexdigest()
+
+
+class CredentialAudit:
+    def __init__(self, candidates_path, store=None, report_path=DEFAULT_REPORT,
+                 checkpoint_path=DEFAULT_CHECKPOINT, workers=None, unit_pairs=DEFAULT_UNIT_PAIRS):
+        """
+        :param candidates_path: Breached-password list, one per line.
+        :param store: User store to audit (default: auth.get_user_store()).
+        :param report_path: CSV file findings are appended to.
+        :param checkpoint_path: JSON file holding resume state.
+        :param workers: Verification processes (default: CPU count).
+        :param unit_pairs: Approximate (user, candidate) pairs per work unit.
+        """
+        self.candidates_path = candidates_path
+        self.store = store or auth.get_user_store()
+        self.report_path = report_path
+        self.checkpoint_path = checkpoint_path
+        self.workers = workers or os.cpu_count() or 1
+        self.unit_pairs = max(1, unit_pairs)
+
+    def _load_users(self):
+        users = []
+        for username in sorted(self.store.usernames()):
+            hashed = self.store.get_hash(username)
+            if hashed:
+                users.append((username, hashed))
+        return users
+
+    def _load_checkpoint(self, fingerprint):
+        fresh = {"candidates": os.path.abspath(self.candidates_path), "users": fingerprint,
+                 "offset": 0, "line_no": 0, "checked_pairs": 0}
+        if not os.path.exists(self.checkpoint_path):
+            return fresh
+        with open(self.checkpoint_path, "r", encoding="utf-8") as fh:
+            state = json.load(fh)
+        # Another list or changed hashes means a different audit
+        if state.get("candidates") != fresh["candidates"] or state.get("users") != fingerprint:
+            return fresh
+        return state
+
+    def _save_checkpoint(self, state):
+        tmp_path = f"{self.checkpoint_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(state, fh, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _reported_usernames(self):
+        if not os.path.exists(self.report_path):
+            return set()
+        with open(self.report_path, "r", encoding="utf-8") as fh:
+            return {line.split(",", 1)[0] for line in fh if line.strip() and not line.startswith("username,")}
+
+    def _units(self, candidates, users_left):
+        """Yield (chunk_no, end_offset, end_line, pairs, [(users, candidates)]) per slice of candidates."""
+        chunk_no = 0
+        while users_left:
+            per_chunk = max(1, self.unit_pairs // len(users_left))
+            chunk = []
+            for line_no, end_offset, password in candidates:
+                chunk.append((line_no, password))
+                end_line = line_no
+                if len(chunk) >= per_chunk:
+                    break
+            if not chunk:
+                return
+            users = list(users_left.items())
+            per_block = max(1, self.unit_pairs // len(chunk))
+            blocks = [(users[i:i + per_block], chunk) for i in range(0, len(users), per_block)]
+            yield chunk_no, end_offset, end_line, len(users) * len(chunk), blocks
+            chunk_no += 1
+
+    def run(self):
+        users = self._load_users()
+        state = self._load_checkpoint(_users_fingerprint(users))
+        reported = self._reported_usernames()
+        users_left = {u: h for u, h in users if u not in reported}
+        backends = dict(users)
+        start = time.perf_counter()
+        print(f" Auditing {len(users_left)} users against {self.candidates_path} "
+              f"with {self.workers} workers (from line {state['line_no'] + 1})...")
+
+        candidates = read_candidates(self.candidates_path, state["offset"], state["line_no"])
+        units = self._units(candidates, users_left)
+        # chunk_no -> [units still running, end_offset, end_line, pairs]; done
+        # chunks only move the checkpoint once every earlier chunk is done too.
+        chunks = {}
+        next_chunk = 0
+        found = checked = 0
+        last_checkpoint = last_progress = time.monotonic()
+        pending = {}
+        new_report = not os.path.exists(self.report_path)
+        with open(self.report_path, "a", encoding="utf-8") as report, \
+                ProcessPoolExecutor(max_workers=self.workers) as pool:
+            if new_report:
+                report.write("username,backend,candidate_line\n")
+            exhausted = False
+            try:
+                while True:
+                    # Keep the pool busy with a bounded number of units in flight
+                    while not exhausted and len(pending) < self.workers * 2:
+                        item = next(units, None)
+                        if item is None:
+                            exhausted = True
+                            break
+                        chunk_no, end_offset, end_line, pairs, blocks = item
+                        chunks[chunk_no] = [len(blocks), end_offset, end_line, pairs]
+                        for block_users, block_candidates in blocks:
+                            pending[pool.submit(_check_unit, block_users, block_candidates)] = chunk_no
+                    if not pending:
+                        break
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        chunk_no = pending.pop(future)
+                        for username, line_no in future.result():
+                            if username in reported:
+                                continue
+                            reported.add(username)
+                            users_left.pop(username, None)
+                            report.write(f"{username},{_backend_name(backends[username])},{line_no}\n")
+                            report.flush()
+                            found += 1
+                        chunks[chunk_no][0] -= 1
+                    while next_chunk in chunks and chunks[next_chunk][0] == 0:
+                        _, state["offset"], state["line_no"], pairs = chunks.pop(next_chunk)
+                        state["checked_pairs"] += pairs
+                        checked += pairs
+                        next_chunk += 1
+                    now = time.monotonic()
+                    if now - last_checkpoint >= CHECKPOINT_EVERY_S:
+                        self._save_checkpoint(state)
+                        last_checkpoint = now
+                    if now - last_progress >= PROGRESS_EVERY_S:
+                        rate = checked / (time.perf_counter() - start)
+                        print(f" Line {state['line_no']}: {checked} pairs checked ({rate:.1f}/s), {found} found")
+                        last_progress = now
+            finally:
+                for future in pending:
+                    future.cancel()
+                self._save_checkpoint(state)
+
+        elapsed = time.perf_counter() - start
+        rate = checked / elapsed if elapsed else 0.0
+        print(f" Checked {checked} pairs in {elapsed:.1f}s ({rate:.1f}/s); {found} new matches "
+              f"written to {self.report_path}")
+        return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit stored password hashes against a breached-password list.")
+    parser.add_argument("candidates_path")
+    parser.add_argument("--workers", type=int, default=None, help="verification processes (default: CPU count)")
+    parser.add_argument("--unit-pairs", type=int, default=DEFAULT_UNIT_PAIRS,
+                        help="(user, candidate) pairs per work unit")
+    parser.add_argument("--report", default=DEFAULT_REPORT)
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.candidates_path):
+        print(f" Error: {args.candidates_path} not found.")
+        return 1
+    audit = CredentialAudit(args.candidates_path, report_path=args.report, checkpoint_path=args.checkpoint,
+                            workers=args.workers, unit_pairs=args.unit_pairs)
+    try:
+        audit.run()
+    except KeyboardInterrupt:
+        print(" Interrupted; progress saved to", args.checkpoint)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
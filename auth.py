@@ -1,52 +1,318 @@
-import bcrypt
 import os
+import threading
+import time
+
+import sessions
+from auth_metrics import timed, get_metrics as get_auth_metrics, write_prometheus as dump_auth_metrics
+from kdf import BcryptKDF, identify as identify_kdf, make_kdf
+from throttle import LoginThrottle
+from user_store import (DEFAULT_ROLE, FileUserStore, LogUserStore, MmapUserStore,
+                        ShardedUserStore, SqliteUserStore, validate_password,
+                        validate_role, validate_username)
 
 USER_DATA_FILE = "users.txt"
+USER_DB_FILE = "DATA/intelligence_platform.db"
+USER_SORTED_FILE = "users.sorted"
+USER_SHARD_DIR = "users.d"
+USER_SHARD_COUNT = 16
+USER_LOG_FILE = "users.log"
+
+# "file" serves users from USER_DATA_FILE, "sqlite" from the users table in
+# USER_DB_FILE, "mmap" from the sorted record file USER_SORTED_FILE,
+# "sharded" from USER_SHARD_COUNT files under USER_SHARD_DIR and "log" from
+# the mutation log USER_LOG_FILE (migrate first with
+# `python user_store.py --backend ...`).
+USER_STORE_BACKEND = os.environ.get("AUTH_USER_STORE", "file")
+_user_store = None
+
+# The store keeps a Bloom filter next to its data ("<location>.bloom", one
+# per shard for "sharded") that answers "definitely not registered" without
+# a store lookup. Set AUTH_BLOOM=0 to disable it.
+BLOOM_ENABLED = os.environ.get("AUTH_BLOOM", "1") != "0"
+
+# bcrypt releases the GIL, so a thread pool verifies/hashes on every core
+AUTH_WORKERS = os.cpu_count() or 1
+_executor = None
+
+# bcrypt cost is calibrated on this host to hit BCRYPT_TARGET_MS per hash;
+# set AUTH_BCRYPT_ROUNDS to pin it instead.
+BCRYPT_TARGET_MS = 100
+BCRYPT_MIN_ROUNDS = 10
+BCRYPT_MAX_ROUNDS = 16
+_bcrypt_rounds = None
+_bcrypt_rounds_lock = threading.Lock()
+
+# AUTH_KDF picks the backend for new hashes ("bcrypt", "scrypt" or
+# "pbkdf2-sha256"); stored hashes of every backend keep verifying, and
+# logins move them to the current one.
+KDF_BACKEND = os.environ.get("AUTH_KDF", "bcrypt")
+_kdf = None
+
+# rehash_migration.py can wrap old bcrypt hashes ("$wrap" + inner bcrypt
+# salt + outer hash of the old hash with the current KDF) so they reach the
+# current settings without the password; the next successful login replaces
+# them with a direct hash.
+WRAP_PREFIX = "$wrap"
+BCRYPT_SALT_LENGTH = 29
+
+# Login attempts are rate limited before verify_password so a flood of bad
+# passwords cannot pin every core. The global rate is roughly what the pool
+# can verify at the calibrated ~100 ms per hash.
+LOGIN_PER_USER_RATE = 0.2
+LOGIN_PER_USER_BURST = 5
+LOGIN_GLOBAL_RATE = 10 * AUTH_WORKERS
+LOGIN_GLOBAL_BURST = 20 * AUTH_WORKERS
+LOGIN_THROTTLE_MAX_USERS = 10_000
+login_throttle = LoginThrottle(LOGIN_PER_USER_RATE, LOGIN_PER_USER_BURST,
+                               LOGIN_GLOBAL_RATE, LOGIN_GLOBAL_BURST,
+                               LOGIN_THROTTLE_MAX_USERS)
+
+def calibrate_bcrypt_rounds(target_ms=BCRYPT_TARGET_MS):
+    # Each extra round doubles the work, so time the cheapest acceptable
+    # cost once and pick the round count whose estimate is nearest the target.
+    import bcrypt
+    sample = b"calibration-sample"
+    bcrypt.hashpw(sample, bcrypt.gensalt(4))
+    start = time.perf_counter()
+    bcrypt.hashpw(sample, bcrypt.gensalt(BCRYPT_MIN_ROUNDS))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rounds = BCRYPT_MIN_ROUNDS
+    while rounds < BCRYPT_MAX_ROUNDS and abs(elapsed_ms * 2 - target_ms) < abs(elapsed_ms - target_ms):
+        rounds += 1
+        elapsed_ms *= 2
+    return rounds
+
+def get_bcrypt_rounds():
+    global _bcrypt_rounds
+    if _bcrypt_rounds is None:
+        with _bcrypt_rounds_lock:
+            if _bcrypt_rounds is None:
+                pinned = os.environ.get("AUTH_BCRYPT_ROUNDS")
+                _bcrypt_rounds = int(pinned) if pinned else calibrate_bcrypt_rounds()
+    return _bcrypt_rounds
+
+def get_kdf():
+    global _kdf
+    if _kdf is None:
+        if KDF_BACKEND == "bcrypt":
+            _kdf = BcryptKDF(get_bcrypt_rounds())
+        else:
+            _kdf = make_kdf(KDF_BACKEND)
+    return _kdf
+
+bcrypt_cost = BcryptKDF.cost
+
+def is_wrapped(hashed_password):
+    return hashed_password.startswith(WRAP_PREFIX)
+
+def needs_rehash(hashed_password):
+    return is_wrapped(hashed_password) or get_kdf().needs_rehash(hashed_password)
+
+def can_wrap(hashed_password):
+    # Only direct bcrypt hashes can be wrapped, and only when the current
+    # settings are stronger (another KDF, or a higher bcrypt cost).
+    if not BcryptKDF.owns(hashed_password) or not needs_rehash(hashed_password):
+        return False
+    kdf = get_kdf()
+    cost = bcrypt_cost(hashed_password)
+    if cost is None:
+        return False  # malformed; it can only be replaced by a login
+    return kdf.name != BcryptKDF.name or cost < kdf.rounds
+
+def wrap_hash(hashed_password):
+    # Hash the stored bcrypt hash again with the current KDF. The inner salt
+    # is kept so verify_password can rebuild the inner hash from the password.
+    inner_salt = hashed_password[:BCRYPT_SALT_LENGTH]
+    with timed("hash"):
+        outer = get_kdf().hash(hashed_password)
+    return WRAP_PREFIX + inner_salt + outer
 
 def hash_password(plain_text_password):
-    password_bytes = plain_text_password.encode('utf-8')
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    return hashed.decode('utf-8')
+    with timed("hash"):
+        return get_kdf().hash(plain_text_password)
 
 def verify_password(plain_text_password, hashed_password):
-    password_bytes = plain_text_password.encode('utf-8')
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    if is_wrapped(hashed_password):
+        inner_salt = hashed_password[len(WRAP_PREFIX):len(WRAP_PREFIX) + BCRYPT_SALT_LENGTH]
+        outer_hash = hashed_password[len(WRAP_PREFIX) + BCRYPT_SALT_LENGTH:]
+        outer_kdf = identify_kdf(outer_hash)
+        if outer_kdf is None:
+            return False
+        import bcrypt
+        with timed("verify"):
+            try:
+                inner_hash = bcrypt.hashpw(plain_text_password.encode('utf-8'), inner_salt.encode('utf-8'))
+            except ValueError:  # truncated inner salt
+                return False
+            return outer_kdf.verify(inner_hash.decode('utf-8'), outer_hash)
+    kdf = identify_kdf(hashed_password)
+    if kdf is None:
+        return False
+    with timed("verify"):
+        return kdf.verify(plain_text_password, hashed_password)
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        from concurrent.futures import ThreadPoolExecutor
+        _executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+    return _executor
+
+def make_user_store(backend):
+    if backend == "file":
+        return FileUserStore(USER_DATA_FILE, bloom=BLOOM_ENABLED)
+    if backend == "sqlite":
+        return SqliteUserStore(USER_DB_FILE, bloom=BLOOM_ENABLED)
+    if backend == "mmap":
+        return MmapUserStore(USER_SORTED_FILE, bloom=BLOOM_ENABLED)
+    if backend == "sharded":
+        return ShardedUserStore(USER_SHARD_DIR, USER_SHARD_COUNT, bloom=BLOOM_ENABLED)
+    if backend == "log":
+        return LogUserStore(USER_LOG_FILE, bloom=BLOOM_ENABLED)
+    raise ValueError(f"Unknown user store backend: {backend}")
+
+def get_user_store():
+    global _user_store
+    if _user_store is None:
+        _user_store = make_user_store(USER_STORE_BACKEND)
+    return _user_store
+
+def set_user_store(store):
+    global _user_store
+    _user_store = store
+
+def _might_exist(username):
+    return get_user_store().might_contain(username)
+
+def add_users(records):
+    # records: (username, hashed, role); returns the usernames added
+    with timed("write"):
+        return get_user_store().add_many(records)
+
+def known_usernames():
+    return get_user_store().usernames()
 
 def user_exists(username):
-    if not os.path.exists(USER_DATA_FILE):
-        return False
-    with open(USER_DATA_FILE, "r") as f:
-        for line in f:
-            stored_username, _ = line.strip().split(",")
-            if stored_username == username:
-                return True
-    return False
-
-def register_user(username, password):
-    if user_exists(username):
-        print(f" Error: Username '{username}' already exists.")
-        return False
+    with timed("lookup"):
+        return _might_exist(username) and get_user_store().exists(username)
+
+def _register(username, password, role=DEFAULT_ROLE):
+    for ok, error in (validate_username(username), validate_password(password), validate_role(role)):
+        if not ok:
+            return False, f" Error: {error}"
+    store = get_user_store()
+    with timed("lookup"):
+        taken = _might_exist(username) and store.exists(username)
+    if taken:
+        return False, f" Error: Username '{username}' already exists."
+    # Hash before the store takes its lock so concurrent registrations only
+    # serialise on the short check-and-append, not on bcrypt.
     hashed = hash_password(password)
-    with open(USER_DATA_FILE, "a") as f:
-        f.write(f"{username},{hashed}\n")
-    print(f" Success: User '{username}' registered successfully!")
-    return True
+    with timed("write"):
+        added = store.add(username, hashed, role)
+    if not added:
+        return False, f" Error: Username '{username}' already exists."
+    return True, f" Success: User '{username}' registered successfully!"
+
+def _login(username, password):
+    store = get_user_store()
+    with timed("lookup"):
+        if not _might_exist(username):
+            # A definite Bloom miss is answered without touching the store
+            return False, " Error: Username not found."
+        stored_hash = store.get_hash(username)
+    if stored_hash is None:
+        if not store.has_users():
+            return False, " No users registered yet."
+        return False, " Error: Username not found."
+    if not login_throttle.allow(username):
+        return False, " Error: Too many login attempts. Please try again later."
+    if verify_password(password, stored_hash):
+        # Only failures are charged, so a user re-entering their password for
+        # change_password/delete_user (or a batch of good logins) is never locked out
+        login_throttle.refund(username)
+        if needs_rehash(stored_hash):
+            new_hash = hash_password(password)
+            with timed("write"):
+                store.update_hash(username, new_hash, expected=stored_hash)
+        return True, f" Success: Welcome, {username}!"
+    return False, " Error: Invalid password."
+
+def _change_password(username, old_password, new_password):
+    ok, message = _login(username, old_password)
+    if not ok:
+        return False, message
+    new_hash = hash_password(new_password)
+    with timed("write"):
+        changed = get_user_store().update_hash(username, new_hash)
+    if not changed:
+        return False, " Error: Username not found."
+    return True, f" Success: Password changed for '{username}'."
+
+def _delete_user(username, password):
+    ok, message = _login(username, password)
+    if not ok:
+        return False, message
+    with timed("write"):
+        deleted = get_user_store().delete(username)
+    if not deleted:
+        return False, " Error: Username not found."
+    return True, f" Success: User '{username}' deleted."
+
+def register_user(username, password, role=DEFAULT_ROLE):
+    ok, message = _register(username, password, role)
+    with timed("output"):
+        print(message)
+    return ok
 
 def login_user(username, password):
-    if not os.path.exists(USER_DATA_FILE):
-        print(" No users registered yet.")
-        return False
-    with open(USER_DATA_FILE, "r") as f:
-        for line in f:
-            stored_username, stored_hash = line.strip().split(",")
-            if stored_username == username:
-                if verify_password(password, stored_hash):
-                    print(f" Success: Welcome, {username}!")
-                    return True
-                else:
-                    print(" Error: Invalid password.")
-                    return False
-    print(" Error: Username not found.")
-    return False
\ No newline at end of file
+    ok, message = _login(username, password)
+    with timed("output"):
+        print(message)
+    return ok
+
+def change_password(username, old_password, new_password):
+    ok, message = _change_password(username, old_password, new_password)
+    print(message)
+    return ok
+
+def delete_user(username, password):
+    ok, message = _delete_user(username, password)
+    print(message)
+    return ok
+
+# Only the first login of a session pays for bcrypt; later identity checks
+# go through check_session.
+def login_user_session(username, password):
+    ok, message = _login(username, password)
+    print(message)
+    if not ok:
+        return None
+    return sessions.create_session(username)
+
+def check_session(token):
+    return sessions.verify_session(token)
+
+def logout_session(token):
+    return sessions.revoke_session(token)
+
+# Batch and async variants return results without printing per user.
+def login_users_batch(pairs):
+    results = _get_executor().map(lambda pair: _login(*pair)[0], pairs)
+    return list(results)
+
+def register_users_batch(pairs):
+    results = _get_executor().map(lambda pair: _register(*pair)[0], pairs)
+    return list(results)
+
+async def login_user_async(username, password):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    ok, _ = await loop.run_in_executor(_get_executor(), _login, username, password)
+    return ok
+
+async def register_user_async(username, password):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    ok, _ = await loop.run_in_executor(_get_executor(), _register, username, password)
+    return ok
\ No newline at end of file
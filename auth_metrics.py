@@ -0,0 +1,155 @@
+import atexit
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+"""
+auth_metrics.py
+
+Per-phase timing for auth operations (lookup, hash, verify, write, output),
+kept in fixed-bucket in-memory histograms.
+
+Disabled by default: timed() then hands back one shared no-op context manager,
+so instrumented code pays a function call and nothing else. Enable with
+AUTH_METRICS=1 (or enable()); set AUTH_METRICS_FILE to also write a
+Prometheus text-format dump when the process exits.
+
+Usage:
+    with timed("verify"):
+        ok = verify_password(password, stored_hash)
+    get_metrics()["verify"]["p95_ms"]
+"""
+
+# Upper bounds in seconds; the final +Inf bucket is implicit.
+BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+ENABLED = os.environ.get("AUTH_METRICS", "0") == "1"
+METRICS_FILE = os.environ.get("AUTH_METRICS_FILE")
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class Histogram:
+    __slots__ = ("counts", "total", "count", "_lock")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        i = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[i] += 1
+            self.total += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th observation (seconds)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return BUCKETS[i] if i < len(BUCKETS) else float("inf")
+        return float("inf")
+
+
+_histograms: Dict[str, Histogram] = {}
+_histograms_lock = threading.Lock()
+
+
+def _histogram(phase: str) -> Histogram:
+    hist = _histograms.get(phase)
+    if hist is None:
+        with _histograms_lock:
+            hist = _histograms.setdefault(phase, Histogram())
+    return hist
+
+
+class _Timer:
+    __slots__ = ("phase", "start")
+
+    def __init__(self, phase: str):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _histogram(self.phase).observe(time.perf_counter() - self.start)
+        return False
+
+
+def timed(phase: str):
+    """Context manager that records the block's duration under `phase`."""
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(phase)
+
+
+def enable(flag: bool = True) -> None:
+    global ENABLED
+    ENABLED = flag
+
+
+def reset() -> None:
+    with _histograms_lock:
+        _histograms.clear()
+
+
+def get_metrics() -> Dict[str, Dict[str, float]]:
+    """Snapshot of every phase: count, total/mean and approximate percentiles in ms."""
+    snapshot = {}
+    for phase, hist in sorted(_histograms.items()):
+        snapshot[phase] = {
+            "count": hist.count,
+            "total_ms": hist.total * 1000,
+            "mean_ms": hist.total / hist.count * 1000 if hist.count else 0.0,
+            "p50_ms": hist.quantile(0.50) * 1000,
+            "p95_ms": hist.quantile(0.95) * 1000,
+            "p99_ms": hist.quantile(0.99) * 1000,
+        }
+    return snapshot
+
+
+def prometheus_text() -> str:
+    lines = [
+        "# HELP auth_phase_seconds Time spent in each auth phase.",
+        "# TYPE auth_phase_seconds histogram",
+    ]
+    for phase, hist in sorted(_histograms.items()):
+        cumulative = 0
+        for bound, n in zip(BUCKETS, hist.counts):
+            cumulative += n
+            lines.append(f'auth_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {cumulative}')
+        lines.append(f'auth_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {hist.count}')
+        lines.append(f'auth_phase_seconds_sum{{phase="{phase}"}} {hist.total}')
+        lines.append(f'auth_phase_seconds_count{{phase="{phase}"}} {hist.count}')
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus(path: Optional[str] = None) -> str:
+    """Write the Prometheus text dump atomically; returns the path written."""
+    path = path or METRICS_FILE or "auth_metrics.prom"
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.write(prometheus_text())
+    os.replace(tmp_path, path)
+    return path
+
+
+def _dump_at_exit() -> None:
+    if ENABLED and METRICS_FILE and _histograms:
+        write_prometheus(METRICS_FILE)
+
+
+atexit.register(_dump_at_exit)
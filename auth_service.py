@@ -0,0 +1,217 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import auth
+import sessions
+from user_store import PRIVILEGED_ROLES
+
+"""
+auth_service.py
+
+A local authentication service so other processes can register, log in and
+check sessions against one warm user index instead of each loading their own.
+
+Protocol: newline-delimited JSON over a Unix socket or loopback TCP. Each
+request is one object; each response echoes its "id" and adds "ok",
+"latency_ms" and, on failure, "error". Requests on one connection may be
+pipelined and are answered as they complete.
+
+    {"id": 1, "op": "register", "username": "alice", "password": "...", "role": "user"}
+    {"id": 2, "op": "login", "username": "alice", "password": "..."}      -> "token"
+    {"id": 3, "op": "verify_session", "token": "..."}                      -> "username"
+    {"id": 4, "op": "logout", "token": "..."}
+    {"id": 5, "op": "stats"}
+
+Registration applies auth._register's username/password/role checks and
+never grants a privileged role (user_store.PRIVILEGED_ROLES) to a client.
+
+bcrypt work runs on a bounded thread pool. Once `workers + max_queue`
+requests are in flight, new hashing requests are refused with "busy" instead
+of queueing without limit.
+
+Usage:
+    python auth_service.py --socket /tmp/auth.sock
+    python auth_service.py --port 8765
+"""
+
+DEFAULT_WORKERS = os.cpu_count() or 1
+DEFAULT_MAX_QUEUE = 64
+LATENCY_WINDOW = 1000
+STRING_FIELDS = ("op", "username", "password", "role", "token")
+
+
+class AuthService:
+    def __init__(self, workers: int = DEFAULT_WORKERS, max_queue: int = DEFAULT_MAX_QUEUE):
+        """
+        :param workers: Threads running bcrypt (it releases the GIL).
+        :param max_queue: Hashing requests allowed to wait for a free worker.
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="auth-service")
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def _offload(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def _busy(self) -> bool:
+        return self.in_flight >= self.workers + self.max_queue
+
+    async def handle(self, request: dict) -> dict:
+        for field in STRING_FIELDS:
+            # Absent fields take their defaults below; a JSON null is not a string
+            if field in request and not isinstance(request[field], str):
+                raise ValueError(f"{field} must be a string")
+        op = request.get("op")
+        if op in ("register", "login") and self._busy():
+            self.rejected += 1
+            return {"ok": False, "error": "busy"}
+        if op == "register":
+            role = request.get("role") or auth.DEFAULT_ROLE
+            if role in PRIVILEGED_ROLES:
+                # Privileged accounts are created by local operators only
+                return {"ok": False, "error": f"role {role!r} cannot be requested over the service"}
+            ok, message = await self._offload(
+                auth._register, request.get("username", ""), request.get("password", ""), role,
+            )
+            return {"ok": ok, "message": message.strip()}
+        if op == "login":
+            username = request.get("username", "")
+            ok, message = await self._offload(auth._login, username, request.get("password", ""))
+            response = {"ok": ok, "message": message.strip()}
+            if ok:
+                response["token"] = sessions.create_session(username)
+            return response
+        if op == "verify_session":
+            username = sessions.verify_session(request.get("token", ""))
+            return {"ok": username is not None, "username": username}
+        if op == "logout":
+            return {"ok": sessions.revoke_session(request.get("token", ""))}
+        if op == "stats":
+            return {"ok": True, "stats": self.stats()}
+        return {"ok": False, "error": f"unknown op: {op!r}"}
+
+    def stats(self) -> dict:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+        return {
+            "served": self.served,
+            "rejected_busy": self.rejected,
+            "in_flight": self.in_flight,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+            "active_sessions": sessions.active_sessions(),
+        }
+
+    async def _respond(self, line: bytes, writer: asyncio.StreamWriter, write_lock: asyncio.Lock) -> None:
+        start = time.perf_counter()
+        request = None
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("request must be a JSON object")
+            response = await self.handle(request)
+        except ValueError as exc:
+            response = {"ok": False, "error": f"bad request: {exc}"}
+        except Exception as exc:
+            # Every request gets an answer, or pipelined clients wait for their timeout
+            response = {"ok": False, "error": f"internal error: {type(exc).__name__}"}
+        if isinstance(request, dict):
+            response["id"] = request.get("id")
+        latency_ms = (time.perf_counter() - start) * 1000
+        response["latency_ms"] = round(latency_ms, 3)
+        self.latencies.append(latency_ms)
+        self.served += 1
+        async with write_lock:
+            writer.write(json.dumps(response).encode("utf-8") + b"\n")
+            await writer.drain()
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        write_lock = asyncio.Lock()
+        pending = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self._respond(line, writer, write_lock))
+                pending.add(task)
+                task.add_done_callback(pending.discard)
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        finally:
+            writer.close()
+
+    async def run(self, socket_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 8765) -> None:
+        auth.user_exists("")  # warm the store index and Bloom filter before accepting clients
+        if socket_path:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            server = await asyncio.start_unix_server(self.serve_connection, path=socket_path)
+            where = socket_path
+        else:
+            server = await asyncio.start_server(self.serve_connection, host=host, port=port)
+            where = f"{host}:{port}"
+        print(f"Auth service listening on {where} ({self.workers} workers, queue {self.max_queue})")
+        async with server:
+            await server.serve_forever()
+
+
+def call(request: dict, socket_path: Optional[str] = None, host: str = "127.0.0.1", port: int = 8765,
+         timeout: float = 30.0) -> dict:
+    """Blocking one-shot client: send one request and return the decoded response."""
+    if socket_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+    else:
+        sock = socket.create_connection((host, port), timeout=timeout)
+    with sock, sock.makefile("rwb") as stream:
+        stream.write(json.dumps(request).encode("utf-8") + b"\n")
+        stream.flush()
+        return json.loads(stream.readline())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local NDJSON authentication service.")
+    parser.add_argument("--socket", help="Unix socket path (default: loopback TCP)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    args = parser.parse_args(argv)
+    if args.host not in ("127.0.0.1", "localhost", "::1"):
+        print("Error: the auth service only binds to loopback addresses.")
+        return 1
+    service = AuthService(workers=args.workers, max_queue=args.max_queue)
+    try:
+        asyncio.run(service.run(socket_path=args.socket, host=args.host, port=args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,182 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+"""
+bench_auth.py
+
+Micro-benchmarks for the auth hot path as the user store grows.
+
+For each store size a synthetic store is generated in a temp directory and
+user_exists / login_user (hit, miss, bad password) / register_user are timed.
+Latency percentiles and ops/sec are printed and written to a JSON baseline;
+pass --compare to flag operations that got slower than a previous baseline.
+
+Usage:
+    python bench_auth.py                          # 1k, 10k, 100k, 1M users
+    python bench_auth.py --sizes 1000 10000 --backend sqlite
+    python bench_auth.py --compare bench_baseline.json
+"""
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+BENCH_PASSWORD = "benchpass"
+REGRESSION_THRESHOLD = 0.20
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "samples": len(ordered),
+        "p50_ms": percentile(ordered, 50) * 1000,
+        "p95_ms": percentile(ordered, 95) * 1000,
+        "p99_ms": percentile(ordered, 99) * 1000,
+        "ops_per_sec": len(ordered) / total if total else 0.0,
+    }
+
+
+def time_calls(func, args_iter):
+    samples = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for args in args_iter:
+            start = time.perf_counter()
+            func(*args)
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def build_store(auth, user_store, backend, directory, size, hashed):
+    records = ((f"user{i}", hashed, "user") for i in range(size))
+    bloom = auth.BLOOM_ENABLED
+    if backend == "file":
+        path = os.path.join(directory, "users.txt")
+        with open(path, "w") as f:
+            f.writelines(f"{u},{h},{r}\n" for u, h, r in records)
+        return user_store.FileUserStore(path, bloom=bloom)
+    if backend == "sqlite":
+        store = user_store.SqliteUserStore(os.path.join(directory, "users.db"), bloom=bloom)
+    elif backend == "sharded":
+        store = user_store.ShardedUserStore(os.path.join(directory, "users.d"), bloom=bloom)
+    elif backend == "log":
+        store = user_store.LogUserStore(os.path.join(directory, "users.log"), bloom=bloom)
+    else:
+        store = user_store.MmapUserStore(os.path.join(directory, "users.sorted"), bloom=bloom)
+    store.add_many(records)
+    if backend == "mmap":
+        store.compact()
+    return store
+
+
+def bench_size(auth, user_store, backend, size, samples, hash_samples, hashed):
+    with tempfile.TemporaryDirectory(prefix="bench_auth_") as directory:
+        start = time.perf_counter()
+        store = build_store(auth, user_store, backend, directory, size, hashed)
+        auth.set_user_store(store)
+        auth.user_exists("warm-up")  # build index / bloom filter outside the timings
+        setup_s = time.perf_counter() - start
+
+        hits = [(f"user{random.randrange(size)}",) for _ in range(samples)]
+        misses = [(f"ghost{i}",) for i in range(samples)]
+        results = {
+            "setup_s": setup_s,
+            "user_exists_hit": summarize(time_calls(auth.user_exists, hits)),
+            "user_exists_miss": summarize(time_calls(auth.user_exists, misses)),
+            "login_miss": summarize(time_calls(auth.login_user, [(u, BENCH_PASSWORD) for (u,) in misses])),
+            "login_hit": summarize(time_calls(auth.login_user, [(u, BENCH_PASSWORD) for (u,) in hits[:hash_samples]])),
+            "login_bad_password": summarize(time_calls(auth.login_user, [(u, "wrong") for (u,) in hits[:hash_samples]])),
+            "register_user": summarize(time_calls(auth.register_user, [(f"newuser{i}", BENCH_PASSWORD) for i in range(hash_samples)])),
+        }
+        auth.set_user_store(None)
+    return results
+
+
+def print_results(size, results):
+    print(f"\n{size:,} users (setup {results['setup_s']:.2f}s)")
+    print(f"  {'operation':<20}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/sec':>12}")
+    for name, stats in results.items():
+        if name == "setup_s":
+            continue
+        print(f"  {name:<20}{stats['p50_ms']:>10.3f}{stats['p95_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['ops_per_sec']:>12.1f}")
+
+
+def compare(baseline_path, report, threshold=REGRESSION_THRESHOLD):
+    """Print operations whose p50 regressed by more than `threshold`; return their count."""
+    with open(baseline_path, "r", encoding="utf-8") as fh:
+        baseline = json.load(fh)
+    regressions = 0
+    for size, ops in report["results"].items():
+        for name, stats in ops.items():
+            old = baseline.get("results", {}).get(size, {}).get(name)
+            if name == "setup_s" or not old or not old["p50_ms"]:
+                continue
+            change = stats["p50_ms"] / old["p50_ms"] - 1
+            if change > threshold:
+                regressions += 1
+                print(f"  REGRESSION {size} {name}: p50 {old['p50_ms']:.3f} -> {stats['p50_ms']:.3f} ms (+{change:.0%})")
+    if not regressions:
+        print(f"  No regressions over {threshold:.0%} against {baseline_path}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark auth lookups, logins and registration by store size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--backend", choices=["file", "sqlite", "mmap", "sharded", "log"], default="file")
+    parser.add_argument("--samples", type=int, default=1000, help="samples for lookup-only operations")
+    parser.add_argument("--hash-samples", type=int, default=50, help="samples for operations that run bcrypt")
+    parser.add_argument("--rounds", type=int, default=4,
+                        help="bcrypt cost for the run; low values keep the lookup path visible (default 4)")
+    parser.add_argument("--no-bloom", action="store_true", help="disable the Bloom filter fast path")
+    parser.add_argument("--output", default="bench_baseline.json")
+    parser.add_argument("--compare", help="previous baseline JSON to check for regressions")
+    args = parser.parse_args(argv)
+
+    os.environ["AUTH_BCRYPT_ROUNDS"] = str(args.rounds)
+    import auth
+    import user_store
+    from throttle import LoginThrottle
+
+    auth.BLOOM_ENABLED = not args.no_bloom
+    # Benchmarks deliberately hammer one account; keep the throttle out of the way.
+    unlimited = float("inf")
+    auth.login_throttle = LoginThrottle(unlimited, unlimited, unlimited, unlimited)
+    hashed = auth.hash_password(BENCH_PASSWORD)
+
+    report = {
+        "backend": args.backend,
+        "bcrypt_rounds": args.rounds,
+        "bloom": not args.no_bloom,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": {},
+    }
+    for size in args.sizes:
+        results = bench_size(auth, user_store, args.backend, size, args.samples, args.hash_samples, hashed)
+        report["results"][str(size)] = results
+        print_results(size, results)
+
+    with open(args.output, "w", encoding="utf-8") as fh:
+        json.dump(report, fh, indent=2)
+    print(f"\nBaseline written to {args.output}")
+
+    if args.compare:
+        return 1 if compare(args.compare, report) else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,137 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+bench_kdf.py
+
+Compare password hashing backends (kdf.py) on this host, to pick one that
+fits the login rate and memory budget.
+
+Each backend runs in its own child process so its peak RSS is not hidden by
+an earlier, hungrier one. For every backend we report CPU time and wall time
+per hash and per verify, hashes/sec and verifies/sec for one core, peak RSS
+growth measured in the child and the theoretical working memory per hash.
+
+Usage:
+    python bench_kdf.py
+    python bench_kdf.py --samples 20 --bcrypt-rounds 12 --scrypt-log-n 15
+    python bench_kdf.py --output kdf_bench.json
+"""
+
+BENCH_PASSWORD = "benchpass"
+
+
+def _maxrss_bytes() -> int:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == "darwin" else rss * 1024  # Linux reports KiB
+
+
+def _bench_backend(name, params, samples):
+    from kdf import make_kdf
+
+    kdf = make_kdf(name, **params)
+    rss_before = _maxrss_bytes()
+    hashed = kdf.hash(BENCH_PASSWORD)  # warm-up; also the hash verified below
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(samples):
+        kdf.hash(BENCH_PASSWORD)
+    hash_cpu, hash_wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for _ in range(samples):
+        kdf.verify(BENCH_PASSWORD, hashed)
+    verify_cpu, verify_wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    return {
+        "backend": name,
+        "params": kdf.describe(),
+        "samples": samples,
+        "hash_cpu_ms": hash_cpu / samples * 1000,
+        "hash_wall_ms": hash_wall / samples * 1000,
+        "hashes_per_sec": samples / hash_wall if hash_wall else 0.0,
+        "verify_cpu_ms": verify_cpu / samples * 1000,
+        "verify_wall_ms": verify_wall / samples * 1000,
+        "verifies_per_sec": samples / verify_wall if verify_wall else 0.0,
+        "peak_rss_growth_bytes": max(0, _maxrss_bytes() - rss_before),
+        "working_memory_bytes": kdf.peak_memory_bytes(),
+    }
+
+
+def run_backend(name, params, samples):
+    """Benchmark one backend in a fresh child process; a failure there is raised here."""
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_bench_backend, name, params, samples).result()
+
+
+def _mib(n):
+    return n / (1024 * 1024)
+
+
+def print_results(results, cores):
+    print(f"\n  {'backend':<32}{'hash ms':>10}{'cpu ms':>10}{'verify ms':>11}"
+          f"{'hash/s':>9}{'verify/s':>10}{'rss MiB':>9}{'mem MiB':>9}")
+    for r in results:
+        print(f"  {r['params']:<32}{r['hash_wall_ms']:>10.2f}{r['hash_cpu_ms']:>10.2f}{r['verify_wall_ms']:>11.2f}"
+              f"{r['hashes_per_sec']:>9.1f}{r['verifies_per_sec']:>10.1f}"
+              f"{_mib(r['peak_rss_growth_bytes']):>9.1f}{_mib(r['working_memory_bytes']):>9.2f}")
+    print(f"\n  Logins/sec on all {cores} cores is about verify/s x {cores}; "
+          f"concurrent logins need mem MiB each.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark password hashing backends on this host.")
+    parser.add_argument("--backends", nargs="+", default=["bcrypt", "scrypt", "pbkdf2-sha256"])
+    parser.add_argument("--samples", type=int, default=10, help="hashes and verifies timed per backend")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--scrypt-log-n", type=int, default=14)
+    parser.add_argument("--scrypt-r", type=int, default=8)
+    parser.add_argument("--scrypt-p", type=int, default=1)
+    parser.add_argument("--pbkdf2-iterations", type=int, default=600_000)
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    params = {
+        "bcrypt": {"rounds": args.bcrypt_rounds},
+        "scrypt": {"log_n": args.scrypt_log_n, "r": args.scrypt_r, "p": args.scrypt_p},
+        "pbkdf2-sha256": {"iterations": args.pbkdf2_iterations},
+    }
+    unknown = [name for name in args.backends if name not in params]
+    if unknown:
+        print(f"Error: unknown backend(s): {', '.join(unknown)}")
+        return 1
+
+    cores = os.cpu_count() or 1
+    print(f"Benchmarking {len(args.backends)} backend(s), {args.samples} samples each...")
+    results = []
+    failed = 0
+    for name in args.backends:
+        try:
+            results.append(run_backend(name, params[name], args.samples))
+        except Exception as exc:  # includes a child that died (BrokenProcessPool)
+            failed += 1
+            print(f"Error: {name} failed: {exc}")
+    if results:
+        print_results(results, cores)
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": cores,
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
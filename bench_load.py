@@ -0,0 +1,124 @@
+import argparse
+import csv
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import db_operations
+from data_layer import DatabaseLayer
+
+"""
+bench_load.py
+
+Compare the plain CSV load path with DatabaseLayer.bulk_load() on synthetic
+cyber_incidents and it_tickets files.
+
+For each table a CSV of --rows rows is generated once. It is then loaded
+into a fresh database twice with the same insert_from_csv call:
+
+- "default": default journaling and synchronous settings, secondary
+  indexes maintained row by row.
+- "bulk_load": the same insert inside db.bulk_load([table]), including the
+  index rebuild and ANALYZE at the end.
+
+Usage:
+    python bench_load.py                      # 1,000,000 rows per table
+    python bench_load.py --rows 100000 --output load_bench.json
+"""
+
+DEFAULT_ROWS = 1_000_000
+SEVERITIES = ["Low", "Medium", "High", "Critical"]
+CATEGORIES = ["Malware", "Phishing", "DDoS", "Insider Threat", "Ransomware", "Unauthorized Access"]
+INCIDENT_STATUSES = ["Open", "In Progress", "Resolved", "Closed"]
+PRIORITIES = ["Low", "Medium", "High", "Critical"]
+TICKET_STATUSES = ["Open", "In Progress", "Resolved", "Waiting for User"]
+ASSIGNEES = [f"IT_Support_{c}" for c in "ABCDEFGH"]
+
+
+def _timestamp(rng):
+    return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"
+
+
+def generate_csv(table, path, rows, seed=1):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as fh:
+        writer = csv.writer(fh)
+        if table == "cyber_incidents":
+            writer.writerow(["incident_id", "timestamp", "severity", "category", "status", "description"])
+            for i in range(rows):
+                writer.writerow([1000 + i, _timestamp(rng), rng.choice(SEVERITIES), rng.choice(CATEGORIES),
+                                 rng.choice(INCIDENT_STATUSES), f"Incident {i} description"])
+        else:
+            writer.writerow(["ticket_id", "priority", "description", "status", "assigned_to", "created_at",
+                             "resolution_time_hours"])
+            for i in range(rows):
+                writer.writerow([2000 + i, rng.choice(PRIORITIES), f"Ticket {i} problem description",
+                                 rng.choice(TICKET_STATUSES), rng.choice(ASSIGNEES), _timestamp(rng),
+                                 rng.randint(1, 120)])
+
+
+def load(table, csv_path, db_path, bulk):
+    db = DatabaseLayer(db_path)
+    db.connect()
+    try:
+        db.create(db_operations.TABLE_SCHEMAS[table])
+        db_operations.create_indexes(db, table)
+        converters = db_operations.column_converters(db, table)
+        start = time.perf_counter()
+        if bulk:
+            with db.bulk_load([table]):
+                rows = db.insert_from_csv(table, csv_path, batch_size=db_operations.LOAD_BATCH_SIZE,
+                                          converters=converters, replace=True)
+        else:
+            rows = db.insert_from_csv(table, csv_path, batch_size=db_operations.LOAD_BATCH_SIZE,
+                                      converters=converters, replace=True)
+        elapsed = time.perf_counter() - start
+    finally:
+        db.close()
+    return {"rows": rows, "seconds": elapsed, "rows_per_sec": rows / elapsed if elapsed else 0.0}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CSV loads with and without bulk_load().")
+    parser.add_argument("--rows", type=int, default=DEFAULT_ROWS)
+    parser.add_argument("--tables", nargs="+", choices=["cyber_incidents", "it_tickets"],
+                        default=["cyber_incidents", "it_tickets"])
+    parser.add_argument("--output", help="write results as JSON")
+    args = parser.parse_args(argv)
+
+    report = {
+        "rows": args.rows,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": {},
+    }
+    with tempfile.TemporaryDirectory(prefix="bench_load_") as directory:
+        for table in args.tables:
+            csv_path = os.path.join(directory, f"{table}.csv")
+            start = time.perf_counter()
+            generate_csv(table, csv_path, args.rows)
+            size_mb = os.path.getsize(csv_path) / (1024 * 1024)
+            print(f"\n{table}: {args.rows:,} rows, {size_mb:.0f} MiB (generated in {time.perf_counter() - start:.1f}s)")
+            results = {}
+            for mode, bulk in (("default", False), ("bulk_load", True)):
+                db_path = os.path.join(directory, f"{table}_{mode}.db")
+                results[mode] = load(table, csv_path, db_path, bulk)
+                print(f"  {mode:<10}{results[mode]['seconds']:>9.2f}s{results[mode]['rows_per_sec']:>14,.0f} rows/s")
+            speedup = results["default"]["seconds"] / results["bulk_load"]["seconds"]
+            results["speedup"] = speedup
+            print(f"  bulk_load is {speedup:.2f}x the default path")
+            report["results"][table] = results
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+        print(f"\nResults written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,284 @@
+import hashlib
+import math
+import os
+import struct
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows has no advisory locks; fall back to unlocked writes
+    fcntl = None
+
+"""
+bloom_filter.py
+
+A file-backed Bloom filter used as a negative cache in front of the user store.
+
+- might_contain(key) == False means the key was definitely never added.
+- add(key) sets k bits in memory and ORs the same bits into the file under an
+  advisory lock, so concurrent writers never clear each other's bits.
+- Readers re-load the bit array only when the file's mtime/size changes.
+- The header carries a 16-byte `source` tag naming the state of the data the
+  filter was built from. add_many(keys, source, expected) moves the tag only
+  if it still equals `expected`, so a writer that did not see every change
+  since then leaves the filter visibly out of date instead of silently wrong.
+
+Usage:
+    bloom = BloomFilter.create("users.txt.bloom", capacity=100_000, fp_rate=0.01)
+    bloom.add("alice")
+    bloom.might_contain("bob")   # False -> bob certainly does not exist
+"""
+
+_MAGIC = b"BLM2"
+_HEADER = struct.Struct("<4sIQQQ16s")  # magic, k, m_bits, capacity, count, source
+_COUNT_OFFSET = 24
+_TAIL = struct.Struct("<Q16s")  # count, source
+
+
+def _lock(fh) -> None:
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock(fh) -> None:
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+
+
+def _open_locked(path: str):
+    """Open and lock `path`, retrying if a rebuild replaced the file meanwhile."""
+    while True:
+        fh = open(path, "r+b")
+        _lock(fh)
+        try:
+            if os.fstat(fh.fileno()).st_ino == os.stat(path).st_ino:
+                return fh
+        except FileNotFoundError:
+            pass
+        _unlock(fh)
+        fh.close()
+
+
+def _runs(offsets: List[int], gap: int = 64) -> List[List[int]]:
+    """Group sorted byte offsets into runs whose neighbours are at most `gap` bytes apart."""
+    runs: List[List[int]] = []
+    for offset in offsets:
+        if runs and offset - runs[-1][-1] <= gap:
+            runs[-1].append(offset)
+        else:
+            runs.append([offset])
+    return runs
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+class BloomFilter:
+    def __init__(self, path: str, bits: bytearray, k: int, capacity: int, count: int = 0, source: bytes = b""):
+        """
+        Wrap an existing bit array; use create() or open() to get an instance.
+
+        :param path: File the filter is persisted to.
+        :param bits: The bit array (len(bits) * 8 == m).
+        :param k: Number of hash probes per key.
+        :param capacity: Number of keys the filter was sized for.
+        :param count: Number of keys added so far.
+        :param source: Tag of the data state the bits reflect (up to 16 bytes).
+        """
+        self.path = path
+        self.bits = bits
+        self.m = len(bits) * 8
+        self.k = k
+        self.capacity = capacity
+        self.count = count
+        self.source = source.ljust(16, b"\0")
+        self._stamp = _stamp(path)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def optimal_size(capacity: int, fp_rate: float, max_bytes: Optional[int] = None) -> Tuple[int, int]:
+        """
+        Return (m_bytes, k) for `capacity` keys at `fp_rate`, capped at `max_bytes`.
+
+        When the cap bites, k is re-derived for the smaller array so the false
+        positive rate degrades as little as possible.
+        """
+        capacity = max(1, capacity)
+        m_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        m_bytes = max(8, math.ceil(m_bits / 8))
+        if max_bytes is not None:
+            m_bytes = min(m_bytes, max_bytes)
+        k = max(1, round(m_bytes * 8 / capacity * math.log(2)))
+        return m_bytes, k
+
+    @classmethod
+    def create(
+        cls,
+        path: str,
+        capacity: int,
+        fp_rate: float = 0.01,
+        max_bytes: Optional[int] = None,
+        keys: Iterable[str] = (),
+        source: bytes = b"",
+    ) -> "BloomFilter":
+        """
+        Build a new filter from `keys` and write it to `path` atomically.
+
+        An add_many() racing with the replace may land in the old file; the
+        caller's `source` tag is what tells readers which data the new file
+        covers, so no lock is held while `keys` is consumed.
+        """
+        m_bytes, k = cls.optimal_size(capacity, fp_rate, max_bytes)
+        bloom = cls(path, bytearray(m_bytes), k, capacity, source=source)
+        for key in keys:
+            for offset, mask in bloom._positions(key):
+                bloom.bits[offset] |= mask
+            bloom.count += 1
+        tmp_path = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "wb") as fh:
+            fh.write(_HEADER.pack(_MAGIC, bloom.k, bloom.m, bloom.capacity, bloom.count, bloom.source))
+            fh.write(bloom.bits)
+            fh.flush()
+            st = os.fstat(fh.fileno())
+        os.replace(tmp_path, path)
+        bloom._stamp = (st.st_ino, st.st_mtime_ns, st.st_size)  # this file's, even if replaced again since
+        return bloom
+
+    @classmethod
+    def open(cls, path: str) -> Optional["BloomFilter"]:
+        """Load a persisted filter, or return None if it is missing or unreadable."""
+        loaded = cls._read(path)
+        if loaded is None:
+            return None
+        bits, k, capacity, count, source, stamp = loaded
+        bloom = cls(path, bits, k, capacity, count, source)
+        bloom._stamp = stamp
+        return bloom
+
+    @staticmethod
+    def _read(path: str):
+        try:
+            with open(path, "rb") as fh:
+                stamp_st = os.fstat(fh.fileno())
+                header = fh.read(_HEADER.size)
+                if len(header) != _HEADER.size:
+                    return None
+                # Header before bits: writers update the bits before the source tag
+                magic, k, m_bits, capacity, count, source = _HEADER.unpack(header)
+                bits = bytearray(fh.read())
+        except FileNotFoundError:
+            return None
+        if magic != _MAGIC or len(bits) * 8 != m_bits:
+            return None
+        return bits, k, capacity, count, source, (stamp_st.st_ino, stamp_st.st_mtime_ns, stamp_st.st_size)
+
+    def _positions(self, key: str) -> List[Tuple[int, int]]:
+        # Kirsch-Mitzenmacher double hashing: k probes from one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        m = self.m
+        positions = []
+        for i in range(self.k):
+            bit = (h1 + i * h2) % m
+            positions.append((bit >> 3, 1 << (bit & 7)))
+        return positions
+
+    def _refresh(self, force: bool = False) -> None:
+        stamp = _stamp(self.path)
+        if stamp is None or (stamp == self._stamp and not force):
+            return
+        loaded = self._read(self.path)
+        if loaded is not None:
+            self.bits, self.k, self.capacity, self.count, self.source, self._stamp = loaded
+            self.m = len(self.bits) * 8
+
+    def might_contain(self, key: str) -> bool:
+        self._refresh()
+        bits = self.bits
+        return all(bits[offset] & mask for offset, mask in self._positions(key))
+
+    def lookup(self, key: str, source: bytes) -> Optional[bool]:
+        """
+        might_contain() against the filter state tagged `source`, or None if
+        the file holds some other state. Not safe to call from several threads.
+        """
+        source = source.ljust(16, b"\0")
+        self._refresh(force=self.source != source)
+        if self.source != source:
+            return None
+        bits = self.bits
+        return all(bits[offset] & mask for offset, mask in self._positions(key))
+
+    def __contains__(self, key: str) -> bool:
+        return self.might_contain(key)
+
+    def add(self, key: str) -> None:
+        self.add_many([key])
+
+    def add_many(self, keys: Iterable[str], source: Optional[bytes] = None,
+                 expected: Optional[bytes] = None) -> None:
+        """
+        Set the keys' bits in memory and OR them into the file under a lock.
+
+        Probes are collected first and the touched bytes grouped into runs,
+        so the file sees one read and one write per run instead of a seek,
+        read and write per probe. If `source` is given, the tag is set to it
+        when the tag on disk still equals `expected`.
+        """
+        with self._lock:
+            fh = _open_locked(self.path)
+            try:
+                ino = os.fstat(fh.fileno()).st_ino
+                _, k, m_bits, capacity, count, on_disk = _HEADER.unpack(fh.read(_HEADER.size))
+                # Every add bumps the count, so a different count (or file) means
+                # another writer got here first: mirror the file so bits and tag agree
+                if self._stamp is None or ino != self._stamp[0] or (count, k, m_bits) != (self.count, self.k, self.m):
+                    self.bits = bytearray(fh.read())
+                    self.k, self.m, self.capacity = k, m_bits, capacity
+                masks: Dict[int, int] = {}
+                for key in keys:
+                    for offset, mask in self._positions(key):
+                        masks[offset] = masks.get(offset, 0) | mask
+                    count += 1
+                bits = self.bits
+                for run in _runs(sorted(masks)):
+                    start = run[0]
+                    fh.seek(_HEADER.size + start)
+                    chunk = bytearray(fh.read(run[-1] + 1 - start))
+                    for offset in run:
+                        chunk[offset - start] |= masks[offset]
+                        bits[offset] |= chunk[offset - start]
+                    fh.seek(_HEADER.size + start)
+                    fh.write(chunk)
+                if source is not None and on_disk == (expected or b"").ljust(16, b"\0"):
+                    on_disk = source.ljust(16, b"\0")
+                fh.seek(_COUNT_OFFSET)
+                fh.write(_TAIL.pack(count, on_disk))  # after the bits, see _read
+                fh.flush()
+                self.count, self.source = count, on_disk
+                st = os.fstat(fh.fileno())
+                self._stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+            finally:
+                _unlock(fh)
+                fh.close()
+
+    def needs_resize(self) -> bool:
+        return self.count > self.capacity
+
+    def stats(self) -> dict:
+        """Size and expected false-positive rate at the current fill."""
+        expected_fp = (1 - math.exp(-self.k * self.count / self.m)) ** self.k
+        return {
+            "bytes": len(self.bits),
+            "k": self.k,
+            "capacity": self.capacity,
+            "count": self.count,
+            "expected_fp_rate": expected_fp,
+        }
@@ -0,0 +1,86 @@
+import argparse
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import auth
+from user_store import DEFAULT_ROLE, validate_password, validate_role, validate_username
+
+PROGRESS_EVERY = 1000
+HASH_CHUNK_SIZE = 32
+
+def _init_worker(rounds):
+    # Reuse the parent's calibrated cost instead of re-calibrating per process
+    auth._bcrypt_rounds = rounds
+
+def read_import_rows(csv_path):
+    # Accepts username,password[,role] with or without a header row.
+    with open(csv_path, newline="", encoding="utf-8") as fh:
+        reader = csv.reader(fh)
+        for line_no, row in enumerate(reader, start=1):
+            if not row:
+                continue
+            if line_no == 1 and row[0].strip().lower() == "username":
+                continue
+            username = row[0].strip()
+            password = row[1].strip() if len(row) > 1 else ""
+            role = row[2].strip() if len(row) > 2 and row[2].strip() else DEFAULT_ROLE
+            yield line_no, username, password, role
+
+def import_users(csv_path, workers=None):
+    start = time.perf_counter()
+    known = set(auth.known_usernames())
+    accepted = []
+    skipped = 0
+    for line_no, username, password, role in read_import_rows(csv_path):
+        ok, error = validate_username(username)
+        if ok:
+            ok, error = validate_password(password)
+        if ok and username in known:
+            ok, error = False, f"Username '{username}' already exists."
+        if ok:
+            ok, error = validate_role(role)
+        if not ok:
+            print(f" Skipped line {line_no}: {error}")
+            skipped += 1
+            continue
+        known.add(username)
+        accepted.append((username, password, role))
+
+    total = len(accepted)
+    print(f" Hashing {total} users with {workers or os.cpu_count()} workers...")
+    records = []
+    rounds = auth.get_bcrypt_rounds()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(rounds,)) as pool:
+        passwords = (password for _, password, _ in accepted)
+        for (username, _, role), hashed in zip(accepted, pool.map(auth.hash_password, passwords, chunksize=HASH_CHUNK_SIZE)):
+            records.append((username, hashed, role))
+            done = len(records)
+            if done % PROGRESS_EVERY == 0:
+                rate = done / (time.perf_counter() - start)
+                print(f" Hashed {done}/{total} users ({rate:.1f} users/s)")
+
+    # One buffered append (file store) or one transaction (sqlite store);
+    # names registered by another process while we were hashing are dropped.
+    added = auth.add_users(records)
+    skipped += total - len(added)
+    elapsed = time.perf_counter() - start
+    rate = len(added) / elapsed if elapsed else 0.0
+    print(f" Imported {len(added)} users, skipped {skipped} in {elapsed:.1f}s ({rate:.1f} users/s)")
+    return len(added)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import users from a username,password,role CSV.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--workers", type=int, default=None, help="hashing processes (default: CPU count)")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.csv_path):
+        print(f" Error: {args.csv_path} not found.")
+        return 1
+    import_users(args.csv_path, workers=args.workers)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
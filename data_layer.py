@@ -1,7 +1,8 @@
 import sqlite3
 import csv
 import json
-from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union, Generator
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union, Generator
 
 """
 data_layer.py
@@ -11,6 +12,7 @@ A lightweight database layer class for SQLite that:
 - Executes arbitrary SQL (CRUD) passed in via the `sql` parameter
 - Inserts rows from CSV files
 - Inserts rows from JSON files
+- Tunes pragmas and defers index builds for bulk loads (bulk_load)
 
 Usage:
     db = DatabaseLayer("my.db")
@@ -99,6 +101,86 @@ class DatabaseLayer:
         finally:
             cur.close()
 
+    @contextmanager
+    def transaction(self) -> Generator[sqlite3.Cursor, None, None]:
+        """
+        Yield a cursor whose statements are committed together on success
+        and rolled back if the block raises.
+        """
+        self._ensure_conn()
+        assert self.conn is not None
+        cur = self.conn.cursor()
+        try:
+            yield cur
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+
+    def _pragma(self, name: str, value: Optional[Any] = None) -> Any:
+        """Read (or set, then read back) a PRAGMA value."""
+        assert self.conn is not None
+        sql = f"PRAGMA {name}" if value is None else f"PRAGMA {name} = {value}"
+        row = self.conn.execute(sql).fetchone()
+        return next(iter(row.values())) if row else None
+
+    @contextmanager
+    def bulk_load(
+        self,
+        tables: Optional[Sequence[str]] = None,
+        cache_size_kib: int = 256 * 1024,
+    ) -> Generator["DatabaseLayer", None, None]:
+        """
+        Tune the connection for a large load, then put everything back.
+
+        Inside the block the database runs with journal_mode=WAL,
+        synchronous=OFF and a cache of `cache_size_kib`, and the secondary
+        indexes of `tables` (all tables if None) are dropped. On exit the
+        indexes are rebuilt from their saved definitions, ANALYZE refreshes
+        the planner statistics and the previous pragmas are restored.
+        synchronous=OFF means a power loss during the load can corrupt the
+        database, so only use this for data that can be reloaded.
+
+        :param tables: Tables whose indexes are deferred until the load finishes.
+        :param cache_size_kib: Page cache size to use while loading, in KiB.
+        """
+        self._ensure_conn()
+        assert self.conn is not None
+        self.conn.commit()  # journal_mode cannot change inside a transaction
+        saved = {name: self._pragma(name) for name in ("journal_mode", "synchronous", "cache_size")}
+
+        sql = "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+        params: List[Any] = []
+        if tables is not None:
+            sql += f" AND tbl_name IN ({','.join(['?'] * len(tables))})"
+            params.extend(tables)
+        # Implicit PRIMARY KEY / UNIQUE indexes have no sql and are kept
+        indexes = self.conn.execute(sql, params).fetchall()
+
+        self._pragma("journal_mode", "WAL")
+        self._pragma("synchronous", "OFF")
+        self._pragma("cache_size", -cache_size_kib)
+        for index in indexes:
+            self.conn.execute(f'DROP INDEX IF EXISTS "{index["name"]}"')
+        self.conn.commit()
+        try:
+            yield self
+        finally:
+            self.conn.commit()
+            for index in indexes:
+                self.conn.execute(index["sql"])
+            if tables is None:
+                self.conn.execute("ANALYZE")
+            else:
+                for table in tables:
+                    self.conn.execute(f"ANALYZE {table}")
+            self.conn.commit()
+            self._pragma("cache_size", saved["cache_size"])
+            self._pragma("synchronous", saved["synchronous"])
+            self._pragma("journal_mode", saved["journal_mode"])
+
     # CRUD convenience wrappers that accept `sql` parameter from outside
     def create(self, sql: str, params: Optional[Sequence[Any]] = None) -> int:
         return self.run_sql(sql, params)
@@ -120,15 +202,24 @@ class DatabaseLayer:
         columns: Optional[Sequence[str]] = None,
         has_header: bool = True,
         batch_size: int = 500,
+        converters: Optional[Dict[str, Callable[[str], Any]]] = None,
+        replace: bool = False,
     ) -> int:
         """
         Insert rows into `table` from a CSV file.
 
+        Rows are streamed in batches, so memory stays flat however large the
+        file is. All batches are committed together at the end (or rolled
+        back if anything fails).
+
         :param table: Destination table name.
         :param csv_path: Path to CSV file.
         :param columns: Optional sequence of column names. If omitted and has_header=True, header will be used.
         :param has_header: If True, expects first CSV row to be header.
-        :param batch_size: Number of rows to insert per executemany commit.
+        :param batch_size: Number of rows to insert per executemany call.
+        :param converters: Optional mapping of column name -> callable applied to each non-empty value;
+                           empty values in those columns are stored as NULL.
+        :param replace: If True, delete the table's existing rows first, in the same transaction.
         :return: Number of rows inserted.
         """
         self._ensure_conn()
@@ -147,15 +238,23 @@ class DatabaseLayer:
                 if columns is None:
                     raise ValueError("columns must be provided when CSV has no header")
                 reader = csv.reader(fh)
+                if has_header:
+                    next(reader, None)  # explicit columns replace the header row
                 columns_to_use = list(columns)
                 row_iter = (tuple(row) for row in reader)
 
+            if converters:
+                row_iter = self._convert_rows(row_iter, columns_to_use, converters)
+
             placeholders = ",".join(["?"] * len(columns_to_use))
-            sql = f"INSERT INTO {table} ({', '.join(columns_to_use)}) VALUES ({placeholders})"
+            quoted = ", ".join(f'"{col}"' for col in columns_to_use)
+            sql = f"INSERT INTO {table} ({quoted}) VALUES ({placeholders})"
 
             cur = self.conn.cursor()
             batch: List[Tuple[Any, ...]] = []
             try:
+                if replace:
+                    cur.execute(f"DELETE FROM {table}")
                 for vals in row_iter:
                     # ensure tuple
                     if isinstance(vals, dict):
@@ -171,10 +270,74 @@ class DatabaseLayer:
                     cur.executemany(sql, batch)
                     inserted += cur.rowcount
                 self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
             finally:
                 cur.close()
         return inserted
 
+    def upsert_many(
+        self,
+        table: str,
+        columns: Sequence[str],
+        key: str,
+        rows: Iterable[Sequence[Any]],
+        batch_size: int = 500,
+    ) -> int:
+        """
+        Insert rows, or update the existing row with the same `key`
+        (INSERT ... ON CONFLICT(key) DO UPDATE). All rows are committed together.
+
+        :param table: Destination table name.
+        :param columns: Column names, in the order of each row's values.
+        :param key: Column with a PRIMARY KEY or UNIQUE constraint to match on.
+        :param rows: Iterable of value sequences; consumed in batches.
+        :param batch_size: Number of rows per executemany call.
+        :return: Number of rows written.
+        """
+        self._ensure_conn()
+        assert self.conn is not None
+        quoted = ", ".join(f'"{col}"' for col in columns)
+        placeholders = ",".join(["?"] * len(columns))
+        updates = ", ".join(f'"{col}" = excluded."{col}"' for col in columns if col != key)
+        sql = (f"INSERT INTO {table} ({quoted}) VALUES ({placeholders}) "
+               f'ON CONFLICT("{key}") DO UPDATE SET {updates}')
+        written = 0
+        cur = self.conn.cursor()
+        batch: List[Tuple[Any, ...]] = []
+        try:
+            for row in rows:
+                batch.append(tuple(row))
+                if len(batch) >= batch_size:
+                    cur.executemany(sql, batch)
+                    written += len(batch)
+                    batch.clear()
+            if batch:
+                cur.executemany(sql, batch)
+                written += len(batch)
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+        finally:
+            cur.close()
+        return written
+
+    @staticmethod
+    def _convert_rows(
+        rows: Iterable[Tuple[Any, ...]],
+        columns: Sequence[str],
+        converters: Dict[str, Callable[[str], Any]],
+    ) -> Generator[Tuple[Any, ...], None, None]:
+        """Apply per-column converters to each row; empty values in converted columns become None."""
+        funcs = [converters.get(col) for col in columns]
+        for row in rows:
+            yield tuple(
+                value if func is None else (func(value) if value not in ("", None) else None)
+                for func, value in zip(funcs, row)
+            )
+
     def insert_from_json(
         self,
         table: str,
@@ -1,69 +1,364 @@
-import sqlite3
-import pandas as pd
+import argparse
+import csv
+import functools
+import hashlib
+import json
+import os
+import sys
+import time
+
+from data_layer import DatabaseLayer
+from user_store import USERS_GENERATION_DDL, FileUserStore
+
+"""
+db_operations.py
+
+Creates the platform tables and loads the domain CSVs and users.txt into the
+SQLite database. Importing this module has no side effects; run it as a
+script (or call load_all()) to load.
+
+CSVs are streamed through DatabaseLayer.insert_from_csv in fixed-size
+batches, so memory stays flat however large the export is. Values are
+converted to each column's declared type, and every file replaces its
+table's rows in one transaction. Tables keep their declared schema (typed
+columns, INTEGER primary keys). Full loads run inside
+DatabaseLayer.bulk_load(): WAL, synchronous=OFF and a large page cache, with
+the secondary indexes on the dashboard filter columns rebuilt and ANALYZEd
+once the rows are in. Tables left untyped
+by the old pandas to_sql loader are rebuilt in place on the next run.
+
+With --merge, tables in MERGE_KEYS are upserted on their key instead of
+replaced. The file is staged in a TEMP table (a key repeated in the file
+keeps its last row) and compared with the stored rows in SQL; rows equal to
+the stored row are skipped, so writes scale with the size of the change
+rather than the dataset, and no per-row state is held in Python.
+
+Loads are incremental: a manifest next to the database records the size,
+mtime and SHA-256 of every source file that was loaded. On the next run a
+source whose size and mtime are unchanged is skipped without being read; if
+they changed but the content hash did not (e.g. the file was touched), only
+the manifest is refreshed. --force reloads everything.
+
+Usage:
+    python db_operations.py
+    python db_operations.py --force
+    python db_operations.py --merge
+"""
+
+DB_PATH = "DATA/intelligence_platform.db"
+CSV_DIR = "CSV"
+USERS_FILE = "users.txt"
+HASH_CHUNK_BYTES = 1024 * 1024
+LOAD_BATCH_SIZE = 5000
+
+CSV_TABLES = {
+    "cyber_incidents": "cyber_incidents.csv",
+    "datasets_metadata": "datasets_metadata.csv",
+    "it_tickets": "it_tickets.csv",
+}
+
+
+# Key each --merge upsert matches on
+MERGE_KEYS = {
+    "cyber_incidents": "incident_id",
+    "it_tickets": "ticket_id",
+}
+
+# Declared-type affinity -> converter for CSV text (see column_converters)
+TYPE_CONVERTERS = {
+    "INTEGER": int,
+    "REAL": float,
+}
+
+
+def connect(db_path=DB_PATH):
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = DatabaseLayer(db_path)
+    db.connect()
+    return db
 
-# Connect to SQLite database
-conn = sqlite3.connect("intelligence_platform.db")
-cursor = conn.cursor()
 
 # --- Create Tables ---
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    username TEXT PRIMARY KEY,
-    password_hash TEXT NOT NULL,
-    role TEXT NOT NULL
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS cyber_incidents (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    incident_type TEXT,
-    severity TEXT,
-    date TEXT,
-    description TEXT
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS datasets_metadata (
-    dataset_id TEXT PRIMARY KEY,
-    name TEXT,
-    source TEXT,
-    last_updated TEXT,
-    description TEXT
-);
-""")
-
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS it_tickets (
-    ticket_id INTEGER PRIMARY KEY,
-    user TEXT,
-    issue TEXT,
-    status TEXT,
-    opened_date TEXT,
-    resolved_date TEXT
-);
-""")
+# Columns match the CSV headers in CSV/.
+TABLE_SCHEMAS = {
+    "users": """
+    CREATE TABLE IF NOT EXISTS users (
+        username TEXT PRIMARY KEY,
+        password_hash TEXT NOT NULL,
+        role TEXT NOT NULL
+    );
+    """,
+    "cyber_incidents": """
+    CREATE TABLE IF NOT EXISTS cyber_incidents (
+        incident_id INTEGER PRIMARY KEY,
+        timestamp TEXT,
+        severity TEXT,
+        category TEXT,
+        status TEXT,
+        description TEXT
+    );
+    """,
+    "datasets_metadata": """
+    CREATE TABLE IF NOT EXISTS datasets_metadata (
+        dataset_id INTEGER PRIMARY KEY,
+        name TEXT,
+        "rows" INTEGER,
+        "columns" INTEGER,
+        uploaded_by TEXT,
+        upload_date TEXT
+    );
+    """,
+    "it_tickets": """
+    CREATE TABLE IF NOT EXISTS it_tickets (
+        ticket_id INTEGER PRIMARY KEY,
+        priority TEXT,
+        description TEXT,
+        status TEXT,
+        assigned_to TEXT,
+        created_at TEXT,
+        resolution_time_hours INTEGER
+    );
+    """,
+}
+
+# Columns the dashboards filter and sort on. Built after each bulk insert
+# rather than maintained row by row during it.
+SECONDARY_INDEXES = {
+    "cyber_incidents": ["severity", "category", "status", "timestamp"],
+    "it_tickets": ["priority", "status", "assigned_to", "created_at"],
+}
+
+
+def _columns(db, table):
+    return db.read("SELECT name, type, pk FROM pragma_table_info(?)", (table,))
+
+
+def _rebuild_legacy_table(db, table):
+    """
+    Recreate `table` with its declared schema if an older pandas to_sql load
+    replaced it with an untyped copy (no primary key), keeping its rows.
+    """
+    existing = _columns(db, table)
+    if not existing or any(column["pk"] for column in existing):
+        return False
+    legacy = f"{table}_legacy"
+    with db.transaction() as cur:
+        cur.execute("BEGIN")  # make the DDL below part of the transaction
+        cur.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+        cur.execute(TABLE_SCHEMAS[table])
+        declared = {column["name"] for column in _columns(db, table)}
+        shared = ", ".join(f'"{column["name"]}"' for column in existing if column["name"] in declared)
+        # Later rows win if the untyped copy held duplicate keys
+        cur.execute(f"INSERT OR REPLACE INTO {table} ({shared}) SELECT {shared} FROM {legacy}")
+        cur.execute(f"DROP TABLE {legacy}")
+    print(f"Rebuilt {table} with its declared schema")
+    return True
+
+
+def create_tables(db):
+    for table, schema in TABLE_SCHEMAS.items():
+        _rebuild_legacy_table(db, table)
+        db.create(schema)
+        create_indexes(db, table)
+    for sql in USERS_GENERATION_DDL:  # lets the auth Bloom filter see rows inserted here
+        db.create(sql)
+
+
+def create_indexes(db, table):
+    for column in SECONDARY_INDEXES.get(table, []):
+        db.create(f'CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ("{column}")')
+
+
+def column_converters(db, table):
+    """Map each INTEGER/REAL column of `table` to the function converting its CSV text."""
+    converters = {}
+    for column in _columns(db, table):
+        func = TYPE_CONVERTERS.get(column["type"].upper())
+        if func:
+            converters[column["name"]] = func
+    return converters
+
+
+# --- Source manifest ---
+def manifest_path(db_path=DB_PATH):
+    return f"{db_path}.manifest.json"
+
+
+def load_manifest(db_path=DB_PATH):
+    path = manifest_path(db_path)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def save_manifest(manifest, db_path=DB_PATH):
+    path = manifest_path(db_path)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        json.dump(manifest, fh, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_changed(manifest, path):
+    """Return (changed, entry): entry is the manifest record describing the file now."""
+    st = os.stat(path)
+    key = os.path.abspath(path)
+    old = manifest.get(key)
+    if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+        return False, old
+    entry = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": file_sha256(path)}
+    return not old or old["sha256"] != entry["sha256"], entry
+
+
+def _table_is_empty(db, table):
+    # create_tables() always leaves the table in place, so an empty one means
+    # the database was recreated behind the manifest's back.
+    return not db.read(f"SELECT 1 FROM {table} LIMIT 1")
+
 
 # --- Load CSV Data ---
-def load_csv(table_name, file_path):
-    df = pd.read_csv(file_path)
-    df.to_sql(table_name, conn, if_exists='replace', index=False)
-    print(f"Loaded {file_path} into {table_name}")
+def load_csv(db, table_name, file_path):
+    start = time.perf_counter()
+    # Indexes are rebuilt once after the insert instead of maintained per row
+    with db.bulk_load([table_name]):
+        rows = db.insert_from_csv(table_name, file_path, batch_size=LOAD_BATCH_SIZE,
+                                  converters=column_converters(db, table_name), replace=True)
+    elapsed = time.perf_counter() - start
+    rate = rows / elapsed if elapsed else 0.0
+    print(f"Loaded {rows} rows from {file_path} into {table_name} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return rows
+
+
+# --- Merge CSV Data ---
+def _read_typed_rows(file_path, columns, converters):
+    with open(file_path, newline="", encoding="utf-8") as fh:
+        for record in csv.DictReader(fh):
+            row = []
+            for column in columns:
+                value = record.get(column)
+                func = converters.get(column)
+                if func is not None:
+                    value = func(value) if value not in ("", None) else None
+                row.append(value)
+            yield tuple(row)
+
+
+def merge_csv(db, table_name, file_path):
+    """Upsert changed and new rows from `file_path` on MERGE_KEYS[table_name]; returns the counts."""
+    start = time.perf_counter()
+    key = MERGE_KEYS[table_name]
+    table_columns = _columns(db, table_name)
+    columns = [column["name"] for column in table_columns]
+    quoted = ", ".join(f'"{column}"' for column in columns)
+    # The file is staged in a TEMP table keyed like the target, so a key
+    # repeated in the file keeps its last row and the comparison with the
+    # stored rows runs in SQLite rather than in a dict sized to the table.
+    staging = f"temp.merge_{table_name}"
+    definitions = ", ".join(f'"{column["name"]}" {column["type"]}' for column in table_columns)
+    db.create(f"DROP TABLE IF EXISTS {staging}")
+    db.create(f'CREATE TEMP TABLE merge_{table_name} ({definitions}, PRIMARY KEY ("{key}"))')
+    try:
+        read = db.upsert_many(staging, columns, key,
+                              _read_typed_rows(file_path, columns, column_converters(db, table_name)),
+                              batch_size=LOAD_BATCH_SIZE)
+        same_key = f't."{key}" = s."{key}"'
+        same_row = " AND ".join(f't."{column}" IS s."{column}"' for column in columns)
+        updates = ", ".join(f'"{column}" = excluded."{column}"' for column in columns if column != key)
+        with db.transaction() as cur:
+            summary = cur.execute(
+                f"SELECT COUNT(*) AS staged,"
+                f" COALESCE(SUM(NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {same_key})), 0) AS inserted,"
+                f" COALESCE(SUM(EXISTS (SELECT 1 FROM {table_name} t WHERE {same_row})), 0) AS unchanged,"
+                f" (SELECT COUNT(*) FROM {table_name} t"
+                f"  WHERE NOT EXISTS (SELECT 1 FROM {staging} s WHERE {same_key})) AS not_in_file"
+                f" FROM {staging} s"
+            ).fetchone()
+            staged, inserted = summary["staged"], summary["inserted"]
+            unchanged, not_in_file = summary["unchanged"], summary["not_in_file"]
+            # Rows identical to the stored one are not rewritten
+            cur.execute(
+                f"INSERT INTO {table_name} ({quoted}) SELECT {quoted} FROM {staging} s"
+                f" WHERE NOT EXISTS (SELECT 1 FROM {table_name} t WHERE {same_row})"
+                f' ON CONFLICT("{key}") DO UPDATE SET {updates}'
+            )
+    finally:
+        db.create(f"DROP TABLE IF EXISTS {staging}")
+
+    counts = {"inserted": inserted, "updated": staged - inserted - unchanged, "unchanged": unchanged,
+              "duplicate_keys": read - staged, "not_in_file": not_in_file}
+    elapsed = time.perf_counter() - start
+    print(f"Merged {file_path} into {table_name} in {elapsed:.2f}s: {counts['inserted']} inserted, "
+          f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+          f"{f', {read - staged} repeated keys (last row kept)' if read != staged else ''}"
+          f"{f', {not_in_file} rows not in the file (kept)' if not_in_file else ''}")
+    return counts
 
-load_csv("cyber_incidents", "DATA/cyber_incidents.csv")
-load_csv("datasets_metadata", "DATA/datasets_metadata.csv")
-load_csv("it_tickets", "DATA/it_tickets.csv")
 
 # --- Migrate users.txt ---
-def migrate_users(file_path):
-    with open(file_path, "r") as f:
-        for line in f:
-            parts = line.strip().split(",")
-            if len(parts) == 3:
-                username, password_hash, role = parts
-                cursor.execute("INSERT OR IGNORE INTO users VALUES (?, ?, ?)", (username, password_hash, role))
-    print("Migrated users.txt into users table")
+def migrate_users(db, file_path):
+    # FileUserStore applies the file's rules: legacy lines without a role get
+    # DEFAULT_ROLE, and a later line for a username supersedes earlier ones.
+    with db.transaction() as cur:
+        for username, password_hash, role in FileUserStore(file_path).items():
+            cur.execute("INSERT OR IGNORE INTO users VALUES (?, ?, ?)", (username, password_hash, role))
+    print(f"Migrated {file_path} into users table")
+
+
+def load_all(db_path=DB_PATH, csv_dir=CSV_DIR, users_file=USERS_FILE, force=False, merge=False):
+    """
+    Create tables, then load every source whose content changed; returns the tables loaded.
+    With merge=True, tables in MERGE_KEYS are upserted instead of replaced.
+    """
+    manifest = {} if force else load_manifest(db_path)
+    loaded = []
+    db = connect(db_path)
+    try:
+        create_tables(db)
+        sources = [(table, os.path.join(csv_dir, name),
+                    functools.partial(merge_csv if merge and table in MERGE_KEYS else load_csv, db, table))
+                   for table, name in CSV_TABLES.items()]
+        sources.append(("users", users_file, functools.partial(migrate_users, db)))
+        for table, path, loader in sources:
+            if not os.path.exists(path):
+                print(f"Skipped {table}: {path} not found")
+                continue
+            changed, entry = source_changed(manifest, path)
+            if changed or _table_is_empty(db, table):
+                loader(path)
+                loaded.append(table)
+            else:
+                print(f"Unchanged {path}; skipped")
+            entry["table"] = table
+            manifest[os.path.abspath(path)] = entry
+            save_manifest(manifest, db_path)  # after each load, so a failure only repeats that file
+    finally:
+        db.close()
+    return loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load the platform CSVs and users.txt into SQLite.")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--csv-dir", default=CSV_DIR)
+    parser.add_argument("--users", default=USERS_FILE)
+    parser.add_argument("--force", action="store_true", help="reload every source, ignoring the manifest")
+    parser.add_argument("--merge", action="store_true",
+                        help="upsert changed rows of cyber_incidents/it_tickets instead of replacing the tables")
+    args = parser.parse_args(argv)
+    load_all(args.db, args.csv_dir, args.users, force=args.force, merge=args.merge)
+    return 0
 
-migrate_users("user.txt")
 
+if __name__ == "__main__":
+    sys.exit(main())
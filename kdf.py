@@ -0,0 +1,210 @@
+import base64
+import hashlib
+import hmac
+import os
+from typing import Optional
+
+"""
+kdf.py
+
+Password hashing backends behind one small interface, so auth.py can switch
+KDFs while stores hold a mix of hash formats:
+
+    hash(password) -> str             # self-describing, comma-free string
+    verify(password, hashed) -> bool  # parameters are read from `hashed`
+    needs_rehash(hashed) -> bool      # hashed uses another backend or weaker parameters
+    owns(hashed) -> bool              # hashed uses this backend's prefix
+
+Formats:
+    bcrypt           $2b$<cost>$<salt+hash>
+    scrypt           $scrypt$ln=<log2 N>$r=<r>$p=<p>$<salt>$<hash>
+    pbkdf2-sha256    $pbkdf2-sha256$<iterations>$<salt>$<hash>
+
+Salts and digests are unpadded base64. identify(hashed) returns a backend
+that can verify any of these formats.
+"""
+
+SALT_BYTES = 16
+DIGEST_BYTES = 32
+# hashlib.scrypt rejects maxmem above INT_MAX
+SCRYPT_MAXMEM_LIMIT = 2**31 - 1
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii").rstrip("=")
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4))
+
+
+class BcryptKDF:
+    name = "bcrypt"
+    prefixes = ("$2a$", "$2b$", "$2y$")
+
+    def __init__(self, rounds: int = 12):
+        self.rounds = rounds
+
+    def describe(self) -> str:
+        return f"bcrypt$cost={self.rounds}"
+
+    @classmethod
+    def owns(cls, hashed: str) -> bool:
+        return hashed.startswith(cls.prefixes)
+
+    @staticmethod
+    def cost(hashed: str) -> Optional[int]:
+        # "$2b$12$..." -> 12
+        try:
+            return int(hashed.split("$")[2])
+        except (IndexError, ValueError):
+            return None
+
+    def hash(self, password: str) -> str:
+        import bcrypt  # deferred: only bcrypt users pay for loading it
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    def verify(self, password: str, hashed: str) -> bool:
+        import bcrypt
+        try:
+            return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+        except ValueError:  # malformed or truncated hash ("Invalid salt")
+            return False
+
+    def needs_rehash(self, hashed: str) -> bool:
+        # Only upgrade: a host that calibrates lower must not weaken stored hashes
+        cost = self.cost(hashed) if self.owns(hashed) else None
+        return cost is None or cost < self.rounds
+
+    def peak_memory_bytes(self) -> int:
+        return 4 * 1024  # Blowfish state; bcrypt is CPU-hard, not memory-hard
+
+
+class ScryptKDF:
+    name = "scrypt"
+    prefix = "$scrypt$"
+
+    def __init__(self, log_n: int = 14, r: int = 8, p: int = 1):
+        if log_n < 1 or r < 1 or p < 1:
+            raise ValueError("scrypt parameters must be positive (log_n, r, p >= 1)")
+        if self._maxmem(log_n, r, p) > SCRYPT_MAXMEM_LIMIT:
+            raise ValueError(f"scrypt ln={log_n} r={r} p={p} needs more than 2 GiB per hash, "
+                             f"which hashlib.scrypt does not allow; lower log_n or r")
+        self.log_n = log_n
+        self.r = r
+        self.p = p
+
+    @staticmethod
+    def _maxmem(log_n: int, r: int, p: int) -> int:
+        return 128 * r * ((1 << log_n) + p + 2) + 1024 * 1024
+
+    def describe(self) -> str:
+        return f"scrypt$ln={self.log_n}$r={self.r}$p={self.p}"
+
+    @classmethod
+    def owns(cls, hashed: str) -> bool:
+        return hashed.startswith(cls.prefix)
+
+    @staticmethod
+    def _params(hashed: str):
+        # "$scrypt$ln=14$r=8$p=1$salt$digest"
+        _, _, ln, r, p, salt, digest = hashed.split("$")
+        return int(ln[3:]), int(r[2:]), int(p[2:]), _unb64(salt), _unb64(digest)
+
+    @staticmethod
+    def _derive(password: str, salt: bytes, log_n: int, r: int, p: int, length: int) -> bytes:
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=1 << log_n, r=r, p=p,
+                              maxmem=min(ScryptKDF._maxmem(log_n, r, p), SCRYPT_MAXMEM_LIMIT), dklen=length)
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        digest = self._derive(password, salt, self.log_n, self.r, self.p, DIGEST_BYTES)
+        return f"{self.prefix}ln={self.log_n}$r={self.r}$p={self.p}${_b64(salt)}${_b64(digest)}"
+
+    def verify(self, password: str, hashed: str) -> bool:
+        try:
+            log_n, r, p, salt, expected = self._params(hashed)
+            derived = self._derive(password, salt, log_n, r, p, len(expected))
+        except ValueError:  # malformed, or parameters hashlib cannot run
+            return False
+        return hmac.compare_digest(derived, expected)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        if not self.owns(hashed):
+            return True
+        try:
+            log_n, r, p, _, _ = self._params(hashed)
+        except ValueError:
+            return True
+        return log_n < self.log_n or r < self.r or p < self.p
+
+    def peak_memory_bytes(self) -> int:
+        return 128 * self.r * (1 << self.log_n) * self.p
+
+
+class PBKDF2KDF:
+    name = "pbkdf2-sha256"
+    prefix = "$pbkdf2-sha256$"
+
+    def __init__(self, iterations: int = 600_000):
+        self.iterations = iterations
+
+    def describe(self) -> str:
+        return f"pbkdf2-sha256$i={self.iterations}"
+
+    @classmethod
+    def owns(cls, hashed: str) -> bool:
+        return hashed.startswith(cls.prefix)
+
+    @staticmethod
+    def _params(hashed: str):
+        # "$pbkdf2-sha256$600000$salt$digest"
+        _, _, iterations, salt, digest = hashed.split("$")
+        return int(iterations), _unb64(salt), _unb64(digest)
+
+    def hash(self, password: str) -> str:
+        salt = os.urandom(SALT_BYTES)
+        digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, self.iterations, DIGEST_BYTES)
+        return f"{self.prefix}{self.iterations}${_b64(salt)}${_b64(digest)}"
+
+    def verify(self, password: str, hashed: str) -> bool:
+        try:
+            iterations, salt, expected = self._params(hashed)
+            digest = hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, iterations, len(expected))
+        except ValueError:  # malformed, or e.g. zero iterations
+            return False
+        return hmac.compare_digest(digest, expected)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        if not self.owns(hashed):
+            return True
+        try:
+            iterations, _, _ = self._params(hashed)
+        except ValueError:
+            return True
+        return iterations < self.iterations
+
+    def peak_memory_bytes(self) -> int:
+        return 1024  # HMAC-SHA256 state only
+
+
+BACKENDS = {
+    BcryptKDF.name: BcryptKDF,
+    ScryptKDF.name: ScryptKDF,
+    PBKDF2KDF.name: PBKDF2KDF,
+}
+
+
+def make_kdf(name: str, **params):
+    try:
+        return BACKENDS[name](**params)
+    except KeyError:
+        raise ValueError(f"Unknown KDF backend: {name}") from None
+
+
+def identify(hashed: str):
+    """Return a backend instance able to verify `hashed`, or None if unrecognised."""
+    for backend in BACKENDS.values():
+        if backend.owns(hashed):
+            return backend()
+    return None
@@ -1,14 +1,24 @@
-from auth import register_user, login_user
+import os
+import sys
+import time
 
-def validate_username(username):
-    if not username.isalnum() or not (3 <= len(username) <= 20):
-        return False, "Username must be 3–20 alphanumeric characters."
-    return True, ""
+# Time from launching `python main.py` to the first menu prompt; checked by
+# `python main.py --startup-time`. Keep heavy imports out of module scope and
+# behind _auth() so this holds.
+STARTUP_TARGET_MS = 50
+STARTUP_RUNS = 5
+MENU_PROMPT = "Please select an option (1-3): "
 
-def validate_password(password):
-    if not (6 <= len(password) <= 50):
-        return False, "Password must be 6–50 characters long."
-    return True, ""
+# Batch mode (`--batch FILE`, "-" for stdin) keeps at most this many commands
+# per worker in flight, so any size of command file runs in bounded memory.
+BATCH_WINDOW_PER_WORKER = 4
+BATCH_CSV_FIELDS = ["op", "username", "password", "role"]
+
+def _auth():
+    # auth pulls in the user stores, KDFs and bcrypt; load it on the first
+    # register/login instead of before the menu is shown.
+    import auth
+    return auth
 
 def display_menu():
     print("\n" + "="*50)
@@ -24,8 +34,9 @@ def main():
     print("\nWelcome to the Week 7 Authentication System!")
     while True:
         display_menu()
-        choice = input("\nPlease select an option (1-3): ").strip()
+        choice = input("\n" + MENU_PROMPT).strip()
         if choice == '1':
+            from user_store import validate_password, validate_username
             print("\n--- USER REGISTRATION ---")
             username = input("Enter a username: ").strip()
             is_valid, error = validate_username(username)
@@ -41,13 +52,13 @@ def main():
             if password != confirm:
                 print("Error: Passwords do not match.")
                 continue
-            register_user(username, password)
+            _auth().register_user(username, password)
 
         elif choice == '2':
             print("\n--- USER LOGIN ---")
             username = input("Enter your username: ").strip()
             password = input("Enter your password: ").strip()
-            login_user(username, password)
+            _auth().login_user(username, password)
             input("\nPress Enter to return to main menu...")
 
         elif choice == '3':
@@ -56,5 +67,218 @@ def main():
         else:
             print("❌ Invalid option. Please select 1, 2, or 3.")
 
+def read_batch_commands(stream, fmt="auto"):
+    """Yield (line_no, command dict) from NDJSON or op,username,password[,role] CSV lines."""
+    import csv
+    import itertools
+    import json
+    lines = iter(stream)
+    if fmt == "auto":
+        head = []
+        for line in lines:
+            head.append(line)
+            if line.strip():
+                break
+        fmt = "ndjson" if head and head[-1].lstrip().startswith("{") else "csv"
+        lines = itertools.chain(head, lines)
+    if fmt == "ndjson":
+        for line_no, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                command = json.loads(line)
+            except ValueError as exc:
+                command = {"error": f"bad JSON: {exc}"}
+            if not isinstance(command, dict):
+                command = {"error": "command must be a JSON object"}
+            for field in BATCH_CSV_FIELDS:
+                if command.get(field) is not None and not isinstance(command[field], str):
+                    command = {"error": f"{field} must be a string"}
+                    break
+            yield line_no, command
+        return
+    first_row = True
+    for line_no, row in enumerate(csv.reader(lines), start=1):
+        if not row or not "".join(row).strip():
+            continue
+        if first_row and row[0].strip().lower() == "op":
+            first_row = False
+            continue  # header row
+        first_row = False
+        yield line_no, {field: value.strip() for field, value in zip(BATCH_CSV_FIELDS, row)}
+
+def run_batch_command(command):
+    """Validate and run one register/login command; returns its result dict, never raises."""
+    start = time.perf_counter()
+    op = command.get("op")
+    username = command.get("username") or ""
+    password = command.get("password") or ""
+    try:
+        if "error" in command:
+            ok, message = False, command["error"]
+        elif op == "register":
+            # _register validates username, password and role (allow-listed,
+            # so no commas or newlines reach users.txt)
+            auth = _auth()
+            ok, message = auth._register(username, password, command.get("role") or auth.DEFAULT_ROLE)
+        elif op == "login":
+            ok, message = _auth()._login(username, password)
+        else:
+            ok, message = False, f"Unknown op: {op!r} (expected register or login)"
+    except Exception as exc:
+        ok, message = False, f"Internal error: {type(exc).__name__}: {exc}"
+    return {
+        "op": op,
+        "username": username,
+        "ok": ok,
+        "message": message.strip(),
+        "latency_ms": round((time.perf_counter() - start) * 1000, 3),
+    }
+
+def _run_after(previous, command):
+    # Commands for one username keep their input order (register before login)
+    if previous is not None:
+        previous.result()
+    return run_batch_command(command)
+
+def run_batch(source, output, fmt="auto", workers=None, throttle=True):
+    """Run every command in `source` on a worker pool, writing one JSON line per command in input order."""
+    import json
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+    auth = _auth()
+    if not throttle:
+        # Trusted operator runs (e.g. checking freshly provisioned accounts)
+        from throttle import LoginThrottle
+        unlimited = float("inf")
+        auth.login_throttle = LoginThrottle(unlimited, unlimited, unlimited, unlimited)
+    workers = workers or auth.AUTH_WORKERS
+    window = deque()
+    last_by_user = {}
+    done = failed = 0
+    start = time.perf_counter()
+
+    def emit(line_no, command, future):
+        username = command.get("username")
+        if last_by_user.get(username) is future:
+            del last_by_user[username]
+        result = {"line": line_no, **future.result()}
+        if "id" in command:
+            result["id"] = command["id"]
+        output.write(json.dumps(result) + "\n")
+        return result["ok"]
+
+    # bcrypt releases the GIL, so threads keep every worker busy
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch") as pool:
+        for line_no, command in read_batch_commands(source, fmt):
+            username = command.get("username")
+            future = pool.submit(_run_after, last_by_user.get(username), command)
+            last_by_user[username] = future
+            window.append((line_no, command, future))
+            if len(window) >= workers * BATCH_WINDOW_PER_WORKER:
+                done += 1
+                failed += not emit(*window.popleft())
+        while window:
+            done += 1
+            failed += not emit(*window.popleft())
+    output.flush()
+    elapsed = time.perf_counter() - start
+    rate = done / elapsed if elapsed else 0.0
+    print(f"Batch: {done} commands, {failed} failed, {elapsed:.2f}s ({rate:.1f} commands/s, {workers} workers)",
+          file=sys.stderr)
+    return 0 if not failed else 1
+
+def import_time_report(top=15):
+    """Re-run startup plus the auth import under -X importtime and summarise it."""
+    import subprocess
+    script = os.path.abspath(__file__)
+    code = ("import sys; sys.path.insert(0, %r); import main; main._auth()" % os.path.dirname(script))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()))
+    by_name = {name.strip(): cumulative for cumulative, _, name in rows}
+    total_us = sum(cumulative for cumulative, _, name in rows if not name.startswith("  "))
+    print(f"\nImport time: {total_us / 1000:.1f} ms in {len(rows)} modules "
+          f"(main {by_name.get('main', 0) / 1000:.1f} ms, auth {by_name.get('auth', 0) / 1000:.1f} ms)")
+    print(f"  {'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, self_us, name in sorted(rows, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+    return 0
+
+def _time_to_prompt():
+    import subprocess
+    start = time.perf_counter()
+    child = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                             stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    seen = b""
+    prompt = MENU_PROMPT.encode("utf-8")
+    while prompt not in seen:
+        chunk = os.read(child.stdout.fileno(), 4096)
+        if not chunk:
+            break
+        seen += chunk
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    child.communicate(b"3\n")
+    return elapsed_ms if prompt in seen else None
+
+def startup_time_report(runs=STARTUP_RUNS, target_ms=STARTUP_TARGET_MS):
+    """Measure launch-to-first-prompt; returns 1 if the median misses the target."""
+    samples = []
+    for _ in range(runs):
+        elapsed_ms = _time_to_prompt()
+        if elapsed_ms is None:
+            print("Error: the menu prompt never appeared.")
+            return 1
+        samples.append(elapsed_ms)
+    samples.sort()
+    median = samples[len(samples) // 2]
+    verdict = "OK" if median <= target_ms else "OVER TARGET"
+    print(f"\nTime to first prompt: median {median:.1f} ms, best {samples[0]:.1f} ms "
+          f"over {runs} runs (target {target_ms} ms) - {verdict}")
+    return 0 if median <= target_ms else 1
+
+def cli(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        main()
+        return 0
+    import argparse  # only paid for when flags are given
+    parser = argparse.ArgumentParser(description="Multi-Domain Intelligence Platform authentication CLI.")
+    parser.add_argument("--importtime", nargs="?", type=int, const=15, metavar="TOP",
+                        help="report the slowest imports (startup plus auth) and exit")
+    parser.add_argument("--startup-time", action="store_true",
+                        help=f"measure time to the first prompt against {STARTUP_TARGET_MS} ms and exit")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="run register/login commands from FILE ('-' for stdin) without prompts")
+    parser.add_argument("--format", choices=["auto", "ndjson", "csv"], default="auto",
+                        help="batch command format (default: detect from the first line)")
+    parser.add_argument("--workers", type=int, default=None, help="batch worker threads (default: CPU count)")
+    parser.add_argument("--no-throttle", action="store_true",
+                        help="lift the login rate limits for this batch run")
+    parser.add_argument("--output", default="-", help="batch results file, one JSON line per command (default: stdout)")
+    args = parser.parse_args(argv)
+    if args.batch:
+        source = sys.stdin if args.batch == "-" else open(args.batch, "r", encoding="utf-8", newline="")
+        output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+        try:
+            return run_batch(source, output, args.format, args.workers, throttle=not args.no_throttle)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+            if output is not sys.stdout:
+                output.close()
+    status = 0
+    if args.importtime is not None:
+        status |= import_time_report(args.importtime)
+    if args.startup_time:
+        status |= startup_time_report()
+    return status
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(cli())
\ No newline at end of file
@@ -0,0 +1,161 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import auth
+
+"""
+rehash_migration.py
+
+Bring stored password hashes up to the current KDF settings (auth.get_kdf():
+a new bcrypt cost or another backend) after they change, without waiting
+for every user to log in.
+
+Modes:
+- "wrap": hash each outdated bcrypt hash again with the current KDF
+  (hash-of-hash, see auth.wrap_hash). Verification then costs at least the
+  new settings, and the next successful login swaps in a direct hash.
+- "login": leave hashes alone and only report how many are outdated; they are
+  upgraded by login_user as users sign in.
+
+The worker runs in one background thread at a capped rate, so at most one
+core is spent on migration and interactive logins are never queued behind it.
+Progress is checkpointed (last username in sorted order plus counters) to a
+JSON file so an interrupted run resumes where it stopped. Wrapped hashes are
+written with one store.update_many call per checkpoint, each entry carrying
+expected=old_hash, so a password changed meanwhile is never overwritten and a
+users.txt store is appended to once per batch instead of once per user.
+
+Usage:
+    python rehash_migration.py --mode wrap --rate 5
+    python rehash_migration.py --mode login
+"""
+
+DEFAULT_CHECKPOINT = "rehash_checkpoint.json"
+DEFAULT_RATE = 5.0
+CHECKPOINT_EVERY = 50
+
+
+class RehashMigration:
+    def __init__(self, store=None, mode: str = "wrap", rate: float = DEFAULT_RATE,
+                 checkpoint_path: str = DEFAULT_CHECKPOINT):
+        """
+        :param store: User store to migrate (default: auth.get_user_store()).
+        :param mode: "wrap" or "login" (see module docstring).
+        :param rate: Maximum hashes wrapped per second.
+        :param checkpoint_path: JSON file holding resume state.
+        """
+        if mode not in ("wrap", "login"):
+            raise ValueError(f"Unknown migration mode: {mode}")
+        self.store = store or auth.get_user_store()
+        self.mode = mode
+        self.rate = rate
+        self.checkpoint_path = checkpoint_path
+        self.state = self._load_checkpoint()
+        self._pending: List[Tuple[str, str, str]] = []  # (username, wrapped, old hash)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _load_checkpoint(self) -> dict:
+        fresh = {"mode": self.mode, "target": auth.get_kdf().describe(), "last_username": None,
+                 "scanned": 0, "outdated": 0, "wrapped": 0, "skipped": 0, "done": False}
+        if not os.path.exists(self.checkpoint_path):
+            return fresh
+        with open(self.checkpoint_path, "r", encoding="utf-8") as fh:
+            state = json.load(fh)
+        # A checkpoint for another mode or target belongs to a different migration
+        if state.get("mode") != self.mode or state.get("target") != fresh["target"]:
+            return fresh
+        return state
+
+    def save_checkpoint(self) -> None:
+        tmp_path = f"{self.checkpoint_path}.tmp{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(self.state, fh, indent=2)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _flush(self) -> None:
+        """Write the wrapped hashes gathered since the last checkpoint in one batch."""
+        if not self._pending:
+            return
+        updated = self.store.update_many(self._pending)
+        self.state["wrapped"] += len(updated)
+        self.state["skipped"] += len(self._pending) - len(updated)
+        self._pending = []
+
+    def run(self) -> dict:
+        """Migrate in the calling thread until done or stop() is called."""
+        # Sorted names give a stable order to resume from; only names are held.
+        names = sorted(self.store.usernames())
+        last = self.state["last_username"]
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        since_checkpoint = 0
+        try:
+            for username in names:
+                if self._stop.is_set():
+                    break
+                if last is not None and username <= last:
+                    continue
+                hashed = self.store.get_hash(username)
+                self.state["scanned"] += 1
+                if hashed and auth.needs_rehash(hashed) and not auth.is_wrapped(hashed):
+                    self.state["outdated"] += 1
+                    if self.mode == "wrap" and auth.can_wrap(hashed):
+                        started = time.monotonic()
+                        self._pending.append((username, auth.wrap_hash(hashed), hashed))
+                        # Pace ourselves so migration never competes with logins for long
+                        remaining = interval - (time.monotonic() - started)
+                        if remaining > 0:
+                            self._stop.wait(remaining)
+                self.state["last_username"] = username
+                since_checkpoint += 1
+                if since_checkpoint >= CHECKPOINT_EVERY:
+                    self._flush()
+                    self.save_checkpoint()
+                    since_checkpoint = 0
+            else:
+                self.state["done"] = True
+        finally:
+            # Also on KeyboardInterrupt: last_username already covers these users
+            self._flush()
+        self.save_checkpoint()
+        return self.state
+
+    def start(self) -> threading.Thread:
+        """Run the migration in a daemon thread."""
+        self._thread = threading.Thread(target=self.run, name="rehash-migration", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        if wait and self._thread is not None:
+            self._thread.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate stored password hashes to the current KDF settings.")
+    parser.add_argument("--mode", choices=["wrap", "login"], default="wrap")
+    parser.add_argument("--rate", type=float, default=DEFAULT_RATE, help="max hashes wrapped per second")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT)
+    args = parser.parse_args(argv)
+
+    migration = RehashMigration(mode=args.mode, rate=args.rate, checkpoint_path=args.checkpoint)
+    print(f"Migrating to {migration.state['target']} ({args.mode} mode)...")
+    try:
+        state = migration.run()
+    except KeyboardInterrupt:
+        migration.save_checkpoint()
+        print("Interrupted; progress saved to", args.checkpoint)
+        return 1
+    print(f"Scanned {state['scanned']}, outdated {state['outdated']}, wrapped {state['wrapped']}, "
+          f"skipped {state['skipped']}{'' if state['done'] else ' (stopped early)'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+
+# Tokens are "<payload>.<signature>" where payload is "username|expires|nonce".
+# The signature lets us reject forged or mangled tokens before touching the
+# table; the table itself is what makes a token live (and revocable).
+SESSION_TTL_SECONDS = 30 * 60
+SESSION_MAX_ENTRIES = 100_000
+SESSION_SWEEP_INTERVAL = 60
+
+_secret = os.environ.get("AUTH_SESSION_SECRET", "").encode('utf-8') or secrets.token_bytes(32)
+_sessions = {}  # token -> (username, expires_at); insertion order ~ expiry order
+_sessions_lock = threading.Lock()
+_next_sweep = 0.0
+
+def _b64(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode('ascii')
+
+def _unb64(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+def _sign(payload):
+    return hmac.new(_secret, payload, hashlib.sha256).digest()
+
+def _sweep(now):
+    global _next_sweep
+    expired = [token for token, (_, expires_at) in _sessions.items() if expires_at <= now]
+    for token in expired:
+        del _sessions[token]
+    _next_sweep = now + SESSION_SWEEP_INTERVAL
+
+def create_session(username, ttl=SESSION_TTL_SECONDS):
+    now = time.time()
+    expires_at = int(now + ttl)
+    payload = f"{username}|{expires_at}|{secrets.token_urlsafe(12)}".encode('utf-8')
+    token = f"{_b64(payload)}.{_b64(_sign(payload))}"
+    with _sessions_lock:
+        if now >= _next_sweep:
+            _sweep(now)
+        while len(_sessions) >= SESSION_MAX_ENTRIES:
+            del _sessions[next(iter(_sessions))]
+        _sessions[token] = (username, expires_at)
+    return token
+
+def verify_session(token):
+    # Returns the username for a live token, otherwise None.
+    try:
+        payload_part, signature_part = token.split(".")
+        payload = _unb64(payload_part)
+        signature = _unb64(signature_part)
+    except (AttributeError, ValueError):
+        return None
+    if not hmac.compare_digest(signature, _sign(payload)):
+        return None
+    now = time.time()
+    entry = _sessions.get(token)
+    if entry is None:
+        return None
+    username, expires_at = entry
+    if expires_at <= now:
+        with _sessions_lock:
+            _sessions.pop(token, None)
+        return None
+    return username
+
+def revoke_session(token):
+    with _sessions_lock:
+        return _sessions.pop(token, None) is not None
+
+def active_sessions():
+    with _sessions_lock:
+        _sweep(time.time())
+        return len(_sessions)
\ No newline at end of file
@@ -0,0 +1,34 @@
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bloom_filter import BloomFilter  # noqa: E402
+
+
+class BloomFilterAddTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "users.txt.bloom")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_writers_keep_each_others_bits(self):
+        first = BloomFilter.create(self.path, capacity=1000, keys=["seed"])
+        second = BloomFilter.open(self.path)
+        first.add_many([f"a{i}" for i in range(300)])
+        second.add_many([f"b{i}" for i in range(300)])  # second's in-memory bits are stale
+        first.add("last")
+
+        keys = ["seed", "last"] + [f"a{i}" for i in range(300)] + [f"b{i}" for i in range(300)]
+        reopened = BloomFilter.open(self.path)
+        self.assertEqual(reopened.count, len(keys))
+        self.assertTrue(all(reopened.might_contain(key) for key in keys))
+        self.assertTrue(all(key in first for key in keys))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kdf import BcryptKDF, PBKDF2KDF, ScryptKDF  # noqa: E402
+
+
+class MalformedHashTest(unittest.TestCase):
+    def test_verify_rejects_malformed_hashes_without_raising(self):
+        cases = [
+            (BcryptKDF(4), ["$2b$12$abcdef", "$2b$99$" + "a" * 53, "$2b$"]),
+            (ScryptKDF(), ["$scrypt$", "$scrypt$ln=x$abc$def"]),
+            (PBKDF2KDF(), ["$pbkdf2-sha256$", "$pbkdf2-sha256$x$abc$def", "$pbkdf2-sha256$0$abc$def"]),
+        ]
+        for kdf, hashes in cases:
+            for hashed in hashes:
+                with self.subTest(kdf=kdf.name, hashed=hashed):
+                    self.assertFalse(kdf.verify("secret1", hashed))
+
+    def test_bcrypt_still_verifies_good_hashes(self):
+        kdf = BcryptKDF(4)
+        hashed = kdf.hash("secret1")
+        self.assertTrue(kdf.verify("secret1", hashed))
+        self.assertFalse(kdf.verify("secret2", hashed))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from throttle import LoginThrottle  # noqa: E402
+
+
+class LoginThrottleTest(unittest.TestCase):
+    def test_refunded_attempts_are_free(self):
+        throttle = LoginThrottle(per_user_rate=0.0, per_user_burst=2, global_rate=0.0, global_burst=3)
+        for _ in range(10):
+            self.assertTrue(throttle.allow("alice1"))
+            throttle.refund("alice1")
+
+    def test_failures_drain_the_user_then_the_global_bucket(self):
+        throttle = LoginThrottle(per_user_rate=0.0, per_user_burst=2, global_rate=0.0, global_burst=3)
+        self.assertTrue(throttle.allow("alice1"))
+        self.assertTrue(throttle.allow("alice1"))
+        self.assertFalse(throttle.allow("alice1"))
+        self.assertTrue(throttle.allow("bob123"))
+        self.assertFalse(throttle.allow("carol1"))  # global burst spent
+
+    def test_refund_never_exceeds_the_burst(self):
+        throttle = LoginThrottle(per_user_rate=0.0, per_user_burst=1, global_rate=0.0, global_burst=10)
+        throttle.allow("alice1")
+        throttle.refund("alice1")
+        throttle.refund("alice1")
+        self.assertTrue(throttle.allow("alice1"))
+        self.assertFalse(throttle.allow("alice1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,295 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_store import (FileUserStore, LogUserStore, MmapUserStore, ShardedUserStore,  # noqa: E402
+                        SqliteUserStore)
+
+HASH = "$2b$04$abcdefghijklmnopqrstuuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ01"
+
+
+def _run_with_timeout(func, timeout=10.0):
+    """Run func in a daemon thread; fail instead of hanging the suite if it never returns."""
+    errors = []
+
+    def target():
+        try:
+            func()
+        except BaseException as exc:  # surfaced below
+            errors.append(exc)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        raise AssertionError(f"{func.__name__} did not finish within {timeout}s (deadlock?)")
+    if errors:
+        raise errors[0]
+
+
+class LogUserStoreCompactionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "users.log")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_inline_compaction_does_not_deadlock(self):
+        store = LogUserStore(self.path, dead_ratio=0.2, min_records=4, background=False)
+
+        def mutate():
+            store.add_many([(f"user{i}", HASH, "user") for i in range(4)])
+            store.delete("user0")  # 5 records, 1 dead -> compacts inside the delete
+
+        _run_with_timeout(mutate)
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(sorted(lines), sorted(f"C,user{i},{HASH},user" for i in range(1, 4)))
+        self.assertEqual(store.dead_records(), 0)
+
+        reopened = LogUserStore(self.path, background=False)
+        self.assertIsNone(reopened.get_hash("user0"))
+        self.assertEqual(reopened.get_hash("user3"), HASH)
+
+    def test_explicit_compact_still_takes_the_lock(self):
+        store = LogUserStore(self.path, background=False)
+        store.add_many([("alice1", HASH, "user"), ("bob123", HASH, "user")])
+        store.update_hash("alice1", HASH.replace("a", "b"))
+        self.assertEqual(store.compact(), 2)
+        self.assertEqual(store.get_hash("alice1"), HASH.replace("a", "b"))
+
+
+class FileUserStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "users.txt")
+        self.store = FileUserStore(self.path)
+        self.store.add_many([("alice1", HASH, "analyst"), ("bob123", HASH, "user")])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_update_appends_a_superseding_record(self):
+        new_hash = HASH.replace("a", "b")
+        self.assertTrue(self.store.update_hash("alice1", new_hash, expected=HASH))
+        self.assertFalse(self.store.update_hash("alice1", HASH, expected=HASH))
+        with open(self.path) as f:
+            self.assertEqual(f.read().splitlines()[-1], f"alice1,{new_hash},analyst")
+        reopened = FileUserStore(self.path)
+        self.assertEqual(reopened.get_hash("alice1"), new_hash)
+        self.assertEqual(list(reopened.items()), [("alice1", new_hash, "analyst"), ("bob123", HASH, "user")])
+
+    def test_delete_replaces_the_file_without_superseded_lines(self):
+        self.store.update_hash("bob123", HASH.replace("a", "b"))
+        self.assertTrue(self.store.delete("alice1"))
+        self.assertFalse(self.store.delete("alice1"))
+        with open(self.path) as f:
+            self.assertEqual(f.read().splitlines(), [f"bob123,{HASH.replace('a', 'b')},user"])
+        self.assertEqual(os.listdir(self.tmp.name).count("users.txt"), 1)
+        self.assertFalse([name for name in os.listdir(self.tmp.name) if ".tmp" in name])
+
+    def test_update_many_is_one_append_and_respects_expected(self):
+        new_hash = HASH.replace("a", "b")
+        updated = self.store.update_many([("alice1", new_hash, HASH), ("bob123", new_hash, "stale"),
+                                          ("nobody", new_hash, None)])
+        self.assertEqual(updated, ["alice1"])
+        with open(self.path) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)
+        with self.assertRaises(ValueError):
+            self.store.update_many([("bob123", new_hash, None), ("alice1", "bad,hash", None)])
+        self.assertEqual(self.store.get_hash("bob123"), HASH)  # nothing applied
+
+    def test_bad_record_rejects_the_whole_batch(self):
+        with self.assertRaises(ValueError):
+            self.store.add_many([("carol1", HASH, "user"), ("dave12", HASH, "root")])
+        self.assertFalse(self.store.exists("carol1"))
+        self.assertTrue(self.store.add("carol1", HASH))
+
+    def test_threads_share_one_index(self):
+        errors = []
+
+        def writer(prefix):
+            try:
+                for i in range(100):
+                    self.store.add(f"{prefix}{i:03d}", HASH)
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+
+        def reader():
+            try:
+                for _ in range(300):
+                    list(self.store.items())
+                    self.store.get_hash("alice1")
+            except Exception as exc:
+                errors.append(exc)
+
+        threads = [threading.Thread(target=writer, args=(p,)) for p in ("wa", "wb")]
+        threads += [threading.Thread(target=reader) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.store.count(), 202)
+        self.assertEqual(FileUserStore(self.path).count(), 202)
+
+    def test_other_writers_lines_are_applied_incrementally(self):
+        other = FileUserStore(self.path)
+        self.assertEqual(other.count(), 2)
+        with open(self.path, "r+b") as f:
+            f.write(b"zzzzz1")  # same size and inode: only a re-parse would see this
+        self.store.add("carol1", HASH)
+        self.store.update_hash("bob123", HASH + "x")
+        self.assertEqual(other.get_hash("carol1"), HASH)
+        self.assertEqual(other.get_hash("bob123"), HASH + "x")
+        self.assertEqual(other.get_hash("alice1"), HASH)
+        self.store.delete("carol1")  # rewrite: new inode, full reload
+        self.assertFalse(other.exists("carol1"))
+        self.assertEqual(other.count(), 2)
+
+    def test_append_after_a_partial_line(self):
+        with open(self.path, "a") as f:
+            f.write("carol1,trunc")  # writer crashed mid-line
+        self.store.add("dave12", HASH)
+        reopened = FileUserStore(self.path)
+        self.assertEqual(reopened.get_hash("dave12"), HASH)
+        self.assertEqual(reopened.get_hash("alice1"), HASH)
+
+
+class MmapUserStoreMergeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "users.sorted")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_background_merge_with_concurrent_readers(self):
+        store = MmapUserStore(self.path, delta_ratio=0.1, min_delta=20)
+        errors = []
+        done = threading.Event()
+
+        def reader():
+            try:
+                while not done.is_set():
+                    store.get_hash("user0000")
+                    sum(1 for _ in store.items())
+            except Exception as exc:  # surfaced below
+                errors.append(exc)
+
+        readers = [threading.Thread(target=reader) for _ in range(2)]
+        for thread in readers:
+            thread.start()
+        for i in range(0, 400, 10):
+            store.add_many([(f"user{j:04d}", HASH, "user") for j in range(i, i + 10)])
+            store.delete(f"user{i:04d}")
+        done.set()
+        for thread in readers:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertIsNotNone(store._merger)  # at least one merge ran off the writer's thread
+
+        self.assertEqual(store.compact(), 360)
+        reopened = MmapUserStore(self.path)
+        self.assertIsNone(reopened.get_hash("user0010"))
+        self.assertEqual(reopened.get_hash("user0011"), HASH)
+        self.assertEqual(reopened.count(), 360)
+
+    def test_inline_merge(self):
+        store = MmapUserStore(self.path, min_delta=5, background=False)
+        store.add_many([(f"user{i:04d}", HASH, "user") for i in range(6)])
+        self.assertEqual(store._delta, {})
+        self.assertEqual(store._base_count, 6)
+        self.assertEqual(store.count(), 6)
+
+    def test_reader_in_another_instance_survives_a_merge(self):
+        writer = MmapUserStore(self.path, background=False)
+        reader = MmapUserStore(self.path)
+        writer.add_many([("alice1", HASH, "user"), ("bob123", HASH, "user")])
+        self.assertTrue(reader.exists("bob123"))  # reader now holds a delta offset
+        writer.compact()
+        writer.add_many([(name, HASH, "user") for name in ("carol", "danny", "eveee")])
+        for name in ("alice1", "bob123", "carol", "danny", "eveee"):
+            self.assertTrue(reader.exists(name), name)
+
+    def test_partial_delta_line_is_ignored_then_replaced(self):
+        store = MmapUserStore(self.path)
+        store.add("alice1", HASH)
+        with open(store.delta_path, "a") as f:
+            f.write("carol1,$2b$1")  # writer crashed mid-line
+        reader = MmapUserStore(self.path)
+        self.assertFalse(reader.exists("carol1"))
+        store.add("dave12", HASH)
+        self.assertFalse(reader.exists("carol1"))
+        self.assertEqual(reader.get_hash("dave12"), HASH)
+        self.assertEqual(reader.count(), 2)
+
+
+
+class UsernameFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _stores(self):
+        root = self.tmp.name
+        return {
+            "file": lambda bloom: FileUserStore(os.path.join(root, "users.txt"), bloom=bloom),
+            "sqlite": lambda bloom: SqliteUserStore(os.path.join(root, "users.db"), bloom=bloom),
+            "mmap": lambda bloom: MmapUserStore(os.path.join(root, "users.sorted"), bloom=bloom),
+            "sharded": lambda bloom: ShardedUserStore(os.path.join(root, "users.d"), 4, bloom=bloom),
+            "log": lambda bloom: LogUserStore(os.path.join(root, "users.log"), bloom=bloom),
+        }
+
+    def test_writers_that_bypass_the_filter_are_still_seen(self):
+        for backend, make in self._stores().items():
+            with self.subTest(backend=backend):
+                filtered = make(True)
+                filtered.add("alice1", HASH)
+                self.assertTrue(filtered.might_contain("alice1"))
+                self.assertFalse(filtered.might_contain("zed28"))
+                make(False).add("zed28", HASH)  # e.g. a process with AUTH_BLOOM=0
+                self.assertTrue(filtered.might_contain("zed28"))
+                self.assertTrue(make(True).might_contain("zed28"))
+
+    def test_filtered_writes_keep_the_filter_current(self):
+        store = FileUserStore(os.path.join(self.tmp.name, "users.txt"), bloom=True)
+        store.add("alice1", HASH)
+        self.assertFalse(store.might_contain("bob123"))
+        bloom_ino = os.stat(store.location + ".bloom").st_ino
+        other = FileUserStore(store.path, bloom=True)
+        other.add("bob123", HASH)
+        other.update_hash("alice1", HASH + "x")
+        self.assertTrue(store.might_contain("bob123"))
+        self.assertFalse(store.might_contain("carol1"))
+        self.assertEqual(os.stat(store.location + ".bloom").st_ino, bloom_ino)  # no rebuild
+
+    @unittest.skipIf(fcntl is None, "needs advisory file locks")
+    def test_shards_do_not_share_a_filter_lock(self):
+        store = ShardedUserStore(os.path.join(self.tmp.name, "users.d"), 4, bloom=True)
+        store.add("alice1", HASH)
+        other = next(name for name in (f"user{i}" for i in range(100))
+                     if store.shard_for(name) is not store.shard_for("alice1"))
+        self.assertFalse(store.might_contain(other))  # builds both shards' filters
+        self.assertTrue(store.might_contain("alice1"))
+        with open(store.shard_for("alice1").location + ".bloom", "r+b") as held:
+            fcntl.flock(held.fileno(), fcntl.LOCK_EX)
+            _run_with_timeout(lambda: store.add(other, HASH), timeout=5.0)
+        self.assertTrue(store.might_contain(other))
+        self.assertFalse(os.path.exists(store.location + ".bloom"))
+
+
+if __name__ == "__main__":
+    unittest.main()
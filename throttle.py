@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+"""
+throttle.py
+
+Token-bucket rate limiting for login attempts, checked before any bcrypt work.
+A token is taken before the password is verified and refunded if it turns
+out correct, so only failed attempts are charged.
+
+- Each username gets its own bucket so one targeted account cannot burn CPU.
+- A global bucket caps failed verifications to what the host can hash.
+- Per-user buckets live in a bounded LRU so memory stays flat under a flood
+  of distinct usernames; an evicted bucket simply starts full again.
+"""
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: Optional[float] = None):
+        """
+        :param rate: Tokens added per second.
+        :param burst: Maximum tokens the bucket can hold.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated = now
+
+    def try_take(self, now: float, amount: float = 1.0) -> bool:
+        self.refill(now)
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True
+        return False
+
+    def give_back(self, now: float, amount: float = 1.0) -> None:
+        self.refill(now)
+        self.tokens = min(self.burst, self.tokens + amount)
+
+
+class LoginThrottle:
+    def __init__(
+        self,
+        per_user_rate: float,
+        per_user_burst: float,
+        global_rate: float,
+        global_burst: float,
+        max_tracked_users: int = 10_000,
+    ):
+        """
+        :param per_user_rate: Sustained attempts per second allowed per username.
+        :param per_user_burst: Attempts a username may make back to back.
+        :param global_rate: Sustained attempts per second across all usernames.
+        :param global_burst: Global burst allowance.
+        :param max_tracked_users: LRU bound on per-user buckets kept in memory.
+        """
+        self.per_user_rate = per_user_rate
+        self.per_user_burst = per_user_burst
+        self.max_tracked_users = max_tracked_users
+        self._global = TokenBucket(global_rate, global_burst)
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def allow(self, username: str) -> bool:
+        """Consume one token from the user's and the global bucket, or neither."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(username)
+            if bucket is None:
+                bucket = TokenBucket(self.per_user_rate, self.per_user_burst, now)
+                self._buckets[username] = bucket
+                if len(self._buckets) > self.max_tracked_users:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(username)
+            bucket.refill(now)
+            self._global.refill(now)
+            if bucket.tokens < 1 or self._global.tokens < 1:
+                return False
+            bucket.tokens -= 1
+            self._global.tokens -= 1
+            return True
+
+    def refund(self, username: str) -> None:
+        """Return the token allow() took, once the attempt turned out to succeed."""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(username)
+            if bucket is not None:  # an evicted bucket starts full anyway
+                bucket.give_back(now)
+            self._global.give_back(now)
+
+    def reset(self, username: Optional[str] = None) -> None:
+        with self._lock:
+            if username is None:
+                self._buckets.clear()
+            else:
+                self._buckets.pop(username, None)
+
+    def tracked_users(self) -> int:
+        return len(self._buckets)
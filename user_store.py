@@ -0,0 +1,1230 @@
+import hashlib
+import mmap
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import IO, TYPE_CHECKING, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+
+from bloom_filter import BloomFilter
+
+if TYPE_CHECKING:
+    from data_layer import DatabaseLayer
+
+try:
+    import fcntl
+except ImportError:  # Windows has no advisory locks; fall back to unlocked appends
+    fcntl = None
+
+"""
+user_store.py
+
+Credential storage backends used by auth.py. Every store offers the same
+small interface so auth.py does not care where hashes live (update_hash with
+`expected` only writes if the stored hash still equals it):
+
+    get_hash(username) -> Optional[str]
+    exists(username) -> bool
+    add(username, password_hash, role) -> bool
+    add_many(records) -> List[str]          # records: (username, hash, role)
+    update_hash(username, password_hash, expected=None) -> bool
+    update_many(updates) -> List[str]       # updates: (username, hash, expected)
+    delete(username) -> bool
+    usernames() -> Iterator[str]
+    items() -> Iterator[(username, hash, role)]
+    has_users() -> bool
+    count() -> int
+    stamp() -> tuple                        # changes whenever the stored data may have
+    might_contain(username) -> bool         # False: certainly not stored
+
+Backends:
+- FileUserStore: the line-oriented users.txt ("username,hash[,role]")
+- SqliteUserStore: the `users` table in the platform database, via DatabaseLayer
+- MmapUserStore: a sorted fixed-width record file searched by bisection, plus
+  an append-only delta file merged back in periodically
+- ShardedUserStore: a directory of FileUserStore shards keyed by username hash
+- LogUserStore: an append-only create/update/delete log with background compaction
+
+Stores opened with bloom=True keep a UsernameFilter ("<location>.bloom")
+that might_contain() consults; other stores answer True.
+"""
+
+DEFAULT_ROLE = "user"
+ROLES = ("user", "analyst", "admin")
+# Roles that may only be granted by local operators (bulk import, batch
+# files), never requested by a client of auth_service.py.
+PRIVILEGED_ROLES = frozenset({"admin"})
+
+Record = Tuple[str, str, str]
+Update = Tuple[str, str, Optional[str]]
+
+BLOOM_FP_RATE = 0.01
+BLOOM_MAX_BYTES = 4 * 1024 * 1024
+BLOOM_MIN_CAPACITY = 100_000
+
+# Counts inserts into `users` whoever makes them, so SqliteUserStore.stamp()
+# changes even for rows written with plain SQL (db_operations.py).
+USERS_GENERATION_DDL = (
+    "CREATE TABLE IF NOT EXISTS users_generation (n INTEGER NOT NULL)",
+    "INSERT INTO users_generation (n) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM users_generation)",
+    "CREATE TRIGGER IF NOT EXISTS users_generation_bump AFTER INSERT ON users "
+    "BEGIN UPDATE users_generation SET n = n + 1; END",
+)
+
+
+def validate_username(username) -> Tuple[bool, str]:
+    if not isinstance(username, str) or not username.isalnum() or not (3 <= len(username) <= 20):
+        return False, "Username must be 3–20 alphanumeric characters."
+    return True, ""
+
+
+def validate_password(password) -> Tuple[bool, str]:
+    if not isinstance(password, str) or not (6 <= len(password) <= 50):
+        return False, "Password must be 6–50 characters long."
+    return True, ""
+
+
+def validate_role(role) -> Tuple[bool, str]:
+    if role not in ROLES:
+        return False, f"Role must be one of: {', '.join(ROLES)}."
+    return True, ""
+
+
+def _validated(records: Iterable[Record]) -> Iterator[Record]:
+    """
+    Yield records unchanged, raising ValueError on the first one that could
+    not be stored safely. Every add_many runs its records through this, so a
+    username, hash or role can never smuggle separators or extra records
+    into a store, whichever entry point it came from.
+    """
+    for username, password_hash, role in records:
+        for ok, error in (validate_username(username), validate_role(role)):
+            if not ok:
+                raise ValueError(f"Invalid user record {username!r}: {error}")
+        _check_hash(username, password_hash)
+        yield username, password_hash, role
+
+
+def _check_hash(username: str, password_hash) -> None:
+    if not isinstance(password_hash, str) or not password_hash or any(c in password_hash for c in ",\r\n"):
+        raise ValueError(f"Invalid user record {username!r}: malformed password hash.")
+
+
+def _lock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def _file_stamp(path: str) -> Optional[Tuple[int, int, int]]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _parse_line(line: str) -> Optional[Record]:
+    parts = line.strip().split(",")
+    if len(parts) < 2:
+        return None
+    role = parts[2] if len(parts) > 2 and parts[2] else DEFAULT_ROLE
+    return parts[0], parts[1], role
+
+
+class UsernameFilter:
+    def __init__(self, path: str, min_capacity: int = BLOOM_MIN_CAPACITY):
+        """
+        A persisted Bloom filter over one store's usernames.
+
+        The filter's source tag is a digest of the store's stamp() at which
+        its bits were last known complete. Writers holding the store lock
+        move the tag from the stamp they found to the one they left behind;
+        a write made any other way (a process with the filter disabled, a
+        migration, a direct SQL insert) leaves the tag behind, and the next
+        lookup rebuilds the filter from the store instead of trusting it.
+
+        :param path: File the filter is persisted to.
+        :param min_capacity: Smallest capacity a rebuild sizes the filter for.
+        """
+        self.path = path
+        self.min_capacity = min_capacity
+        self._bloom: Optional[BloomFilter] = None
+        self._mutex = threading.Lock()
+
+    @staticmethod
+    def _tag(stamp) -> bytes:
+        return hashlib.blake2b(repr(stamp).encode("utf-8"), digest_size=16).digest()
+
+    def _open(self) -> Optional[BloomFilter]:
+        if self._bloom is None:
+            self._bloom = BloomFilter.open(self.path)
+        return self._bloom
+
+    def might_contain(self, username: str, store) -> bool:
+        """Check `username`, rebuilding from `store` if the filter does not match its stamp."""
+        stamp = store.stamp()  # before reading any keys, so a rebuild can only over-cover it
+        tag = self._tag(stamp)
+        with self._mutex:
+            bloom = self._open()
+            found = bloom.lookup(username, tag) if bloom is not None else None
+            if found is not None and not bloom.needs_resize():
+                return found
+        # Built without _mutex: writers call noted() while holding the store's
+        # lock, which usernames() may need.
+        capacity = max(self.min_capacity, 2 * store.count())
+        bloom = BloomFilter.create(self.path, capacity, BLOOM_FP_RATE, BLOOM_MAX_BYTES,
+                                   keys=store.usernames(), source=tag)
+        with self._mutex:
+            self._bloom = bloom
+            return bloom.lookup(username, tag) is not False
+
+    def noted(self, before, after, added: List[str]) -> None:
+        """Record a write that took the store from stamp `before` to `after`, adding `added`."""
+        if before == after:
+            return
+        with self._mutex:
+            bloom = self._open()
+            if bloom is None:
+                return  # the next lookup builds it
+            try:
+                bloom.add_many(added, source=self._tag(after), expected=self._tag(before))
+            except FileNotFoundError:
+                self._bloom = None
+
+    @contextmanager
+    def noting(self, store) -> Generator[List[str], None, None]:
+        """Wrap a write made under the store lock; the caller lists the usernames it added."""
+        before = store.stamp()
+        added: List[str] = []
+        yield added
+        self.noted(before, store.stamp(), added)
+
+
+@contextmanager
+def _noting(store_filter: Optional[UsernameFilter], store) -> Generator[List[str], None, None]:
+    if store_filter is None:
+        yield []
+    else:
+        with store_filter.noting(store) as added:
+            yield added
+
+
+class FileUserStore:
+    def __init__(self, path: str = "users.txt", bloom: bool = False, bloom_capacity: int = BLOOM_MIN_CAPACITY):
+        """
+        Store users in a line-oriented text file.
+
+        Lookups are served from an in-memory username -> (hash, role) index
+        that applies only the lines appended since it was last loaded, and
+        re-reads the whole file only after a rewrite swapped it. A later line
+        for a username supersedes earlier ones, so update_hash is one append;
+        delete rewrites the file without the user (and without superseded
+        lines) into a temp file that replaces users.txt atomically.
+
+        Writers serialise on "<path>.lock" rather than the file itself,
+        because a rewrite swaps the file out from under any lock held on it.
+        Threads sharing the store also hold `_mutex` around the index.
+
+        :param path: Path to the users file.
+        :param bloom: Keep a UsernameFilter in "<path>.bloom" for might_contain().
+        :param bloom_capacity: Smallest capacity the filter is built for.
+        """
+        self.path = path
+        self.location = path
+        self.lock_path = path + ".lock"
+        self._index: Dict[str, Tuple[str, str]] = {}
+        self._stamp: Optional[Tuple[int, int]] = None  # (inode, bytes applied)
+        self._mutex = threading.RLock()
+        self._filter = UsernameFilter(path + ".bloom", bloom_capacity) if bloom else None
+
+    def _load_index(self) -> Dict[str, Tuple[str, str]]:
+        # Caller holds _mutex, so _index and _stamp always change together
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._index, self._stamp = {}, None
+            return self._index
+        if self._stamp == (st.st_ino, st.st_size):
+            return self._index
+        with open(self.path, "rb") as f:
+            fst = os.fstat(f.fileno())
+            start = 0
+            if self._stamp and self._stamp[0] == fst.st_ino and self._stamp[1] <= fst.st_size:
+                start = self._stamp[1]
+            else:
+                self._index = {}
+            f.seek(start)
+            chunk = f.read()
+        # An unterminated last line is indexed but not counted as applied, so
+        # it is read again once a writer finishes it (or a later line wins).
+        complete = chunk.rfind(b"\n") + 1
+        text = chunk[:complete].decode("utf-8") + chunk[complete:].decode("utf-8", "replace")
+        index = self._index
+        for line in text.splitlines():
+            record = _parse_line(line)
+            if record:
+                index[record[0]] = (record[1], record[2])
+        self._stamp = (fst.st_ino, start + complete)
+        return index
+
+    def get_hash(self, username: str) -> Optional[str]:
+        with self._mutex:
+            entry = self._load_index().get(username)
+        return entry[0] if entry else None
+
+    def exists(self, username: str) -> bool:
+        return self.get_hash(username) is not None
+
+    def stamp(self) -> Optional[Tuple[int, int, int]]:
+        return _file_stamp(self.path)
+
+    def might_contain(self, username: str) -> bool:
+        return self._filter is None or self._filter.might_contain(username, self)
+
+    def has_users(self) -> bool:
+        return self.count() > 0
+
+    def count(self) -> int:
+        with self._mutex:
+            return len(self._load_index())
+
+    def usernames(self) -> Iterator[str]:
+        with self._mutex:
+            names = list(self._load_index())
+        return iter(names)
+
+    def items(self) -> Iterator[Record]:
+        """Yield the live record per user (the last line for each username)."""
+        with self._mutex:
+            snapshot = list(self._load_index().items())
+        for username, (password_hash, role) in snapshot:
+            yield username, password_hash, role
+
+    @contextmanager
+    def _locked(self) -> Generator[Dict[str, Tuple[str, str]], None, None]:
+        with self._mutex, open(self.lock_path, "a") as lock:
+            _lock_file(lock)
+            try:
+                yield self._load_index()
+            finally:
+                _unlock_file(lock)
+
+    def _append(self, lines: List[str]) -> None:
+        # Caller holds _locked()
+        with open(self.path, "ab+") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    lines.insert(0, "\n")  # finish a line left partial by a crashed writer
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            st = os.fstat(f.fileno())
+        self._stamp = (st.st_ino, st.st_size)
+
+    def add(self, username: str, password_hash: str, role: str = DEFAULT_ROLE) -> bool:
+        return bool(self.add_many([(username, password_hash, role)]))
+
+    def add_many(self, records: Iterable[Record]) -> List[str]:
+        """
+        Append records whose usernames are not taken, in one locked pass.
+
+        :return: Usernames actually added (names taken by other processes are skipped).
+        """
+        records = list(_validated(records))  # reject a bad batch before the index changes
+        with self._locked() as index, _noting(self._filter, self) as added:
+            lines: List[str] = []
+            for username, password_hash, role in records:
+                if username in index:
+                    continue
+                index[username] = (password_hash, role)
+                added.append(username)
+                lines.append(f"{username},{password_hash},{role}\n")
+            if lines:
+                self._append(lines)
+            return added
+
+    def update_hash(self, username: str, password_hash: str, expected: Optional[str] = None) -> bool:
+        return bool(self.update_many([(username, password_hash, expected)]))
+
+    def update_many(self, updates: Iterable[Update]) -> List[str]:
+        """
+        Append a superseding record per user in one locked pass (O(1) each).
+
+        :return: Usernames updated (missing users and `expected` mismatches are skipped).
+        """
+        updates = list(updates)
+        for username, password_hash, _ in updates:
+            _check_hash(username, password_hash)  # before the index is touched
+        with self._locked() as index, _noting(self._filter, self):
+            updated: List[str] = []
+            lines: List[str] = []
+            for username, password_hash, expected in updates:
+                entry = index.get(username)
+                if entry is None or (expected is not None and entry[0] != expected):
+                    continue
+                index[username] = (password_hash, entry[1])
+                updated.append(username)
+                lines.append(f"{username},{password_hash},{entry[1]}\n")
+            if lines:
+                self._append(lines)
+            return updated
+
+    def delete(self, username: str) -> bool:
+        """Drop one user by rewriting the file under the lock (O(file), used rarely)."""
+        with self._locked() as index, _noting(self._filter, self):
+            if index.pop(username, None) is None:
+                return False
+            self._rewrite_locked(index)
+            return True
+
+    def compact(self) -> int:
+        """Rewrite the file as one line per live user, dropping superseded lines."""
+        with self._locked() as index, _noting(self._filter, self):
+            self._rewrite_locked(index)
+            return len(index)
+
+    def _rewrite_locked(self, index: Dict[str, Tuple[str, str]]) -> None:
+        # Caller holds _locked(). A crash leaves either the old or the new file.
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as out:
+            for username, (password_hash, role) in index.items():
+                out.write(f"{username},{password_hash},{role}\n")
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._stamp = (st.st_ino, st.st_size)
+
+
+class SqliteUserStore:
+    def __init__(self, db_path: str, bloom: bool = False):
+        """
+        Store users in the `users(username PRIMARY KEY, password_hash, role)` table.
+
+        Lookups are primary-key index seeks. Each thread gets its own
+        DatabaseLayer because sqlite3 connections are not shared across threads.
+
+        :param db_path: Path to the SQLite database file.
+        :param bloom: Keep a UsernameFilter in "<db_path>.bloom" for might_contain().
+        """
+        self.db_path = db_path
+        self.location = db_path
+        self._local = threading.local()
+        self._filter = UsernameFilter(db_path + ".bloom") if bloom else None
+
+    def _db(self) -> "DatabaseLayer":
+        db = getattr(self._local, "db", None)
+        if db is None:
+            from data_layer import DatabaseLayer  # sqlite3 is only loaded for this backend
+            db = DatabaseLayer(self.db_path)
+            db.connect()
+            db.create(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "username TEXT PRIMARY KEY, password_hash TEXT NOT NULL, role TEXT NOT NULL)"
+            )
+            for sql in USERS_GENERATION_DDL:
+                db.create(sql)
+            self._local.db = db
+        return db
+
+    def get_hash(self, username: str) -> Optional[str]:
+        rows = self._db().read("SELECT password_hash FROM users WHERE username = ?", (username,))
+        return rows[0]["password_hash"] if rows else None
+
+    def exists(self, username: str) -> bool:
+        return bool(self._db().read("SELECT 1 AS found FROM users WHERE username = ?", (username,)))
+
+    def has_users(self) -> bool:
+        return bool(self._db().read("SELECT 1 AS found FROM users LIMIT 1"))
+
+    def count(self) -> int:
+        return self._db().read("SELECT COUNT(*) AS n FROM users")[0]["n"]
+
+    def stamp(self) -> Tuple[int, int]:
+        generation = self._db().read("SELECT n FROM users_generation")[0]["n"]
+        return (os.stat(self.db_path).st_ino, generation)
+
+    def might_contain(self, username: str) -> bool:
+        return self._filter is None or self._filter.might_contain(username, self)
+
+    def usernames(self) -> Iterator[str]:
+        for row in self._db().conn.execute("SELECT username FROM users ORDER BY username"):
+            yield row["username"]
+
+    def items(self) -> Iterator[Record]:
+        sql = "SELECT username, password_hash, role FROM users ORDER BY username"
+        for row in self._db().conn.execute(sql):
+            yield row["username"], row["password_hash"], row["role"]
+
+    def add(self, username: str, password_hash: str, role: str = DEFAULT_ROLE) -> bool:
+        return bool(self.add_many([(username, password_hash, role)]))
+
+    def add_many(self, records: Iterable[Record]) -> List[str]:
+        """Insert records in one transaction; existing usernames are left untouched."""
+        records = _validated(records)
+        added: List[str] = []
+        with self._db().transaction() as cur:
+            for username, password_hash, role in records:
+                cur.execute(
+                    "INSERT OR IGNORE INTO users (username, password_hash, role) VALUES (?, ?, ?)",
+                    (username, password_hash, role),
+                )
+                if cur.rowcount:
+                    added.append(username)
+            if added:
+                # The first insert took the write lock, so every bump since is ours
+                generation = cur.execute("SELECT n FROM users_generation").fetchone()["n"]
+        if added and self._filter is not None:
+            # Noted after the commit: a rolled-back generation could be reused
+            ino = os.stat(self.db_path).st_ino
+            self._filter.noted((ino, generation - len(added)), (ino, generation), added)
+        return added
+
+    def update_hash(self, username: str, password_hash: str, expected: Optional[str] = None) -> bool:
+        if expected is None:
+            changed = self._db().update(
+                "UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username)
+            )
+        else:
+            changed = self._db().update(
+                "UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                (password_hash, username, expected),
+            )
+        return changed > 0
+
+    def update_many(self, updates: Iterable[Update]) -> List[str]:
+        """Apply updates in one transaction; returns the usernames that changed."""
+        updated: List[str] = []
+        with self._db().transaction() as cur:
+            for username, password_hash, expected in updates:
+                _check_hash(username, password_hash)
+                if expected is None:
+                    cur.execute("UPDATE users SET password_hash = ? WHERE username = ?", (password_hash, username))
+                else:
+                    cur.execute(
+                        "UPDATE users SET password_hash = ? WHERE username = ? AND password_hash = ?",
+                        (password_hash, username, expected),
+                    )
+                if cur.rowcount:
+                    updated.append(username)
+        return updated
+
+    def delete(self, username: str) -> bool:
+        return self._db().delete("DELETE FROM users WHERE username = ?", (username,)) > 0
+
+
+class MmapUserStore:
+    USERNAME_WIDTH = 32
+    HASH_WIDTH = 160
+    ROLE_WIDTH = 31
+    RECORD_SIZE = USERNAME_WIDTH + HASH_WIDTH + ROLE_WIDTH + 1  # trailing newline
+
+    def __init__(self, path: str, delta_ratio: float = 0.1, min_delta: int = 10_000, background: bool = True,
+                 bloom: bool = False):
+        """
+        Store users in a sorted file of fixed-width records opened with mmap.
+
+        Lookups bisect the mapped file in O(log n) without materialising any
+        records. New and changed records go to a small append-only delta file
+        ("<path>.delta") that is merged back into the sorted file once it holds
+        more than max(min_delta, delta_ratio * base records) entries, in a
+        background thread by default. Deletes are delta tombstones
+        ("username,,") dropped by the merge.
+
+        A merge swaps in a fresh delta whose first line ("#<generation>") is
+        random, so a reader never resumes mid-file in a delta it has not seen,
+        even if the inode number is reused. Writers serialise on
+        "<path>.lock" because of that swap; threads sharing the store also
+        hold `_mutex` around the cached map and delta. A merge writes the new
+        sorted file without `_mutex`, so lookups only wait for the swap.
+
+        :param path: Path to the sorted record file.
+        :param delta_ratio: Delta size, relative to the base, that triggers a merge.
+        :param min_delta: Delta entries always tolerated before a merge.
+        :param background: Merge in a daemon thread instead of inline.
+        :param bloom: Keep a UsernameFilter in "<path>.bloom" for might_contain().
+        """
+        self.path = path
+        self.location = path
+        self.delta_path = path + ".delta"
+        self.lock_path = path + ".lock"
+        self.delta_ratio = delta_ratio
+        self.min_delta = min_delta
+        self.background = background
+        self._mm: Optional[mmap.mmap] = None
+        self._base_count = 0
+        self._base_stamp: Optional[Tuple[int, int, int]] = None
+        self._delta: Dict[str, Record] = {}
+        self._delta_stamp: Optional[Tuple[int, bytes, int]] = None  # (inode, generation, bytes applied)
+        self._delta_seen: Optional[Tuple[int, int, int]] = None  # stat at the last sync
+        self._mutex = threading.RLock()
+        self._merger: Optional[threading.Thread] = None
+        self._filter = UsernameFilter(path + ".bloom") if bloom else None
+
+    # -- encoding -------------------------------------------------------------
+
+    @classmethod
+    def _encode(cls, record: Record) -> bytes:
+        username, password_hash, role = (field.encode("utf-8") for field in record)
+        if len(username) > cls.USERNAME_WIDTH or b"," in username or b"\0" in username:
+            raise ValueError(f"Username does not fit a {cls.USERNAME_WIDTH}-byte record: {record[0]!r}")
+        if len(password_hash) > cls.HASH_WIDTH or len(role) > cls.ROLE_WIDTH:
+            raise ValueError(f"Hash or role too long for a fixed-width record: {record[0]!r}")
+        return (
+            username.ljust(cls.USERNAME_WIDTH, b"\0")
+            + password_hash.ljust(cls.HASH_WIDTH, b"\0")
+            + role.ljust(cls.ROLE_WIDTH, b"\0")
+            + b"\n"
+        )
+
+    def _decode_at(self, i: int, mm: Optional[mmap.mmap] = None) -> Record:
+        mm = mm or self._mm
+        assert mm is not None
+        off = i * self.RECORD_SIZE
+        raw = mm[off:off + self.RECORD_SIZE - 1]
+        u, h, r = self.USERNAME_WIDTH, self.USERNAME_WIDTH + self.HASH_WIDTH, self.RECORD_SIZE - 1
+        return (
+            raw[:u].rstrip(b"\0").decode("utf-8"),
+            raw[u:h].rstrip(b"\0").decode("utf-8"),
+            raw[h:r].rstrip(b"\0").decode("utf-8"),
+        )
+
+    # -- refresh --------------------------------------------------------------
+
+    def _refresh_base(self) -> None:
+        try:
+            st = os.stat(self.path)
+            stamp: Optional[Tuple[int, int, int]] = (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            stamp = None
+        if stamp == self._base_stamp:
+            return
+        # Not closed here: an items() iterator may still hold the old map, which
+        # is unmapped once the last reference goes.
+        self._mm = None
+        self._base_count = 0
+        if stamp is not None and stamp[2] >= self.RECORD_SIZE:
+            with open(self.path, "rb") as fh:
+                self._mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self._base_count = len(self._mm) // self.RECORD_SIZE
+        self._base_stamp = stamp
+
+    def _refresh_delta(self) -> None:
+        # Only the newly appended tail is parsed unless a merge swapped the delta.
+        try:
+            st = os.stat(self.delta_path)
+        except FileNotFoundError:
+            self._delta, self._delta_stamp, self._delta_seen = {}, None, None
+            return
+        if self._delta_seen == (st.st_ino, st.st_mtime_ns, st.st_size):
+            return
+        with open(self.delta_path, "rb") as f:
+            self._sync_delta(f)
+
+    def _sync_delta(self, f) -> None:
+        st = os.fstat(f.fileno())
+        first = f.readline()
+        generation = first if first.startswith(b"#") and first.endswith(b"\n") else b""
+        start = 0
+        if self._delta_stamp and self._delta_stamp[:2] == (st.st_ino, generation) and self._delta_stamp[2] <= st.st_size:
+            start = self._delta_stamp[2]
+        else:
+            self._delta = {}
+        f.seek(start)
+        chunk = f.read()
+        # Ignore a trailing partial line from a writer that is mid-append
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            record = _parse_line(line)
+            if record:
+                self._delta[record[0]] = record
+        self._delta_stamp = (st.st_ino, generation, start + len(complete))
+        self._delta_seen = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _refresh(self) -> None:
+        # Delta first: a merge replaces the base before swapping in a fresh
+        # delta, so this order never sees a new (empty) delta with an old base.
+        self._refresh_delta()
+        self._refresh_base()
+
+    # -- lookups --------------------------------------------------------------
+
+    def _base_find(self, username: str) -> int:
+        """Bisect the mapped file; return the record index or -1."""
+        mm = self._mm
+        if mm is None:
+            return -1
+        key = username.encode("utf-8").ljust(self.USERNAME_WIDTH, b"\0")
+        width, size = self.USERNAME_WIDTH, self.RECORD_SIZE
+        lo, hi = 0, self._base_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = mid * size
+            probe = mm[off:off + width]
+            if probe < key:
+                lo = mid + 1
+            elif probe > key:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _get(self, username: str) -> Optional[Record]:
+        with self._mutex:
+            self._refresh()
+            record = self._delta.get(username)
+            if record is not None:
+                return record if record[1] else None
+            if len(username.encode("utf-8")) > self.USERNAME_WIDTH:
+                return None
+            i = self._base_find(username)
+            return self._decode_at(i) if i >= 0 else None
+
+    def get_hash(self, username: str) -> Optional[str]:
+        record = self._get(username)
+        return record[1] if record else None
+
+    def exists(self, username: str) -> bool:
+        return self._get(username) is not None
+
+    def stamp(self) -> Tuple[Optional[Tuple[int, int, int]], Optional[Tuple[int, int, int]]]:
+        return (_file_stamp(self.path), _file_stamp(self.delta_path))
+
+    def might_contain(self, username: str) -> bool:
+        return self._filter is None or self._filter.might_contain(username, self)
+
+    def has_users(self) -> bool:
+        with self._mutex:
+            self._refresh()
+            return self._base_count > 0 or any(record[1] for record in self._delta.values())
+
+    def count(self) -> int:
+        with self._mutex:
+            self._refresh()
+            total = self._base_count
+            for username, record in self._delta.items():
+                in_base = self._base_find(username) >= 0
+                if record[1] and not in_base:
+                    total += 1
+                elif not record[1] and in_base:
+                    total -= 1
+            return total
+
+    def items(self) -> Iterator[Record]:
+        """Yield all live records in username order (base merged with delta)."""
+        with self._mutex:
+            self._refresh()
+            mm, base_count, delta = self._mm, self._base_count, dict(self._delta)
+        pending = sorted(delta)
+        j = 0
+        for i in range(base_count):
+            record = self._decode_at(i, mm)
+            while j < len(pending) and pending[j] < record[0]:
+                if delta[pending[j]][1]:
+                    yield delta[pending[j]]
+                j += 1
+            if j < len(pending) and pending[j] == record[0]:
+                record = delta[pending[j]]
+                j += 1
+            if record[1]:
+                yield record
+        for username in pending[j:]:
+            if delta[username][1]:
+                yield delta[username]
+
+    def usernames(self) -> Iterator[str]:
+        for record in self.items():
+            yield record[0]
+
+    # -- writes ---------------------------------------------------------------
+
+    @contextmanager
+    def _locked(self) -> Generator[IO[bytes], None, None]:
+        """Hold the store lock and _mutex, with the delta and base refreshed."""
+        with open(self.lock_path, "a") as lock:
+            _lock_file(lock)
+            try:
+                with self._mutex, open(self.delta_path, "ab+") as f:
+                    f.seek(0)
+                    self._sync_delta(f)
+                    self._refresh_base()
+                    yield f
+            finally:
+                _unlock_file(lock)
+
+    def add(self, username: str, password_hash: str, role: str = DEFAULT_ROLE) -> bool:
+        return bool(self.add_many([(username, password_hash, role)]))
+
+    def add_many(self, records: Iterable[Record]) -> List[str]:
+        """Append unseen usernames to the delta file under its lock."""
+        records = list(_validated(records))  # reject a bad batch before the delta changes
+        with self._locked() as f, _noting(self._filter, self) as added:
+            lines: List[str] = []
+            for record in records:
+                username = record[0]
+                self._encode(record)  # validate widths before accepting
+                if username in self._delta:
+                    if self._delta[username][1]:
+                        continue
+                elif self._base_find(username) >= 0:
+                    continue
+                self._delta[username] = record
+                added.append(username)
+                lines.append(",".join(record) + "\n")
+            self._append_delta(f, lines)
+            return added
+
+    def update_hash(self, username: str, password_hash: str, expected: Optional[str] = None) -> bool:
+        """Append the new hash to the delta; it shadows the base record."""
+        return bool(self.update_many([(username, password_hash, expected)]))
+
+    def update_many(self, updates: Iterable[Update]) -> List[str]:
+        """Append every new hash to the delta in one locked write."""
+        updates = list(updates)
+        for username, password_hash, _ in updates:
+            _check_hash(username, password_hash)
+        return self._shadow(updates)
+
+    def delete(self, username: str) -> bool:
+        """Append a tombstone to the delta; the next merge drops the record."""
+        return bool(self._shadow([(username, "", None)]))
+
+    def _shadow(self, updates: Iterable[Update]) -> List[str]:
+        with self._locked() as f, _noting(self._filter, self):
+            changed: List[str] = []
+            lines: List[str] = []
+            for username, password_hash, expected in updates:
+                current = self._delta.get(username)
+                if current is None:
+                    i = self._base_find(username)
+                    if i < 0:
+                        continue
+                    current = self._decode_at(i)
+                if not current[1] or (expected is not None and current[1] != expected):
+                    continue
+                record = (username, password_hash, current[2] if password_hash else "")
+                self._encode(record)
+                self._delta[username] = record
+                changed.append(username)
+                lines.append(",".join(record) + "\n")
+            self._append_delta(f, lines)
+            return changed
+
+    def _append_delta(self, f, lines: List[str]) -> None:
+        # Caller holds _locked(), so the delta ends exactly at our stamp
+        if not lines:
+            return
+        if self._delta_stamp is not None and self._delta_seen is not None and self._delta_stamp[2] < self._delta_seen[2]:
+            f.truncate(self._delta_stamp[2])  # drop a line left partial by a crashed writer
+        f.write("".join(lines).encode("utf-8"))
+        f.flush()
+        st = os.fstat(f.fileno())
+        generation = self._delta_stamp[1] if self._delta_stamp else b""
+        self._delta_stamp = (st.st_ino, generation, st.st_size)
+        self._delta_seen = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if len(self._delta) <= max(self.min_delta, self.delta_ratio * self._base_count):
+            return
+        if not self.background:
+            self._merge_locked()
+        elif self._merger is None or not self._merger.is_alive():
+            self._merger = threading.Thread(target=self.compact, name="user-mmap-merger", daemon=True)
+            self._merger.start()
+
+    def compact(self) -> int:
+        """Merge the delta into the sorted file now; returns the record count."""
+        with open(self.lock_path, "a") as lock:
+            _lock_file(lock)
+            try:
+                with self._mutex:
+                    self._refresh_delta()
+                with _noting(self._filter, self):
+                    return self._merge_locked()
+            finally:
+                _unlock_file(lock)
+
+    def _merge_locked(self) -> int:
+        # Caller holds the store lock, so no writer can change the delta while
+        # the merged, sorted records go to a temp file; _mutex is only taken
+        # to swap it and a fresh delta in. A crash between the two replaces
+        # leaves the old delta over the new base, which replays harmlessly.
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        written = 0
+        with open(tmp_path, "wb") as out:
+            for record in self.items():
+                out.write(self._encode(record))
+                written += 1
+            out.flush()
+            os.fsync(out.fileno())
+        generation = f"#{os.urandom(8).hex()}\n".encode("ascii")
+        delta_tmp = f"{self.delta_path}.tmp{os.getpid()}"
+        with open(delta_tmp, "wb") as out:
+            out.write(generation)
+            out.flush()
+            os.fsync(out.fileno())
+            st = os.fstat(out.fileno())
+        with self._mutex:
+            os.replace(tmp_path, self.path)
+            os.replace(delta_tmp, self.delta_path)
+            self._delta = {}
+            self._delta_stamp = (st.st_ino, generation, st.st_size)
+            self._delta_seen = (st.st_ino, st.st_mtime_ns, st.st_size)
+            self._refresh_base()
+        return written
+
+
+class ShardedUserStore:
+    META_FILE = "SHARDS"
+
+    def __init__(self, directory: str, shards: int = 16, bloom: bool = False):
+        """
+        Spread users over `shards` FileUserStore files keyed by a stable hash.
+
+        Each operation touches one small shard, and registrations that land
+        on different shards take different locks. That includes the Bloom
+        filter: each shard keeps its own ("users-NNN.txt.bloom", sized for a
+        1/shards share of the users), so a registration never waits on
+        another shard's filter lock. The shard count is recorded in the
+        directory so a store is never reopened with a different layout.
+
+        :param directory: Directory holding users-NNN.txt shard files.
+        :param shards: Number of shards for a new store.
+        :param bloom: Give every shard a UsernameFilter of its own.
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, self.META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as fh:
+                existing = int(fh.read().strip())
+            if existing != shards:
+                raise ValueError(f"{directory} was created with {existing} shards, not {shards}")
+        else:
+            with open(meta_path, "w") as fh:
+                fh.write(f"{shards}\n")
+        self.directory = directory
+        self.location = directory
+        self.shards = [
+            FileUserStore(os.path.join(directory, f"users-{i:03d}.txt"), bloom=bloom,
+                          bloom_capacity=max(1, BLOOM_MIN_CAPACITY // shards))
+            for i in range(shards)
+        ]
+
+    def shard_for(self, username: str) -> FileUserStore:
+        # crc32 is stable across processes, unlike the salted built-in hash()
+        return self.shards[zlib.crc32(username.encode("utf-8")) % len(self.shards)]
+
+    def get_hash(self, username: str) -> Optional[str]:
+        return self.shard_for(username).get_hash(username)
+
+    def exists(self, username: str) -> bool:
+        return self.shard_for(username).exists(username)
+
+    def stamp(self) -> tuple:
+        return tuple(shard.stamp() for shard in self.shards)
+
+    def might_contain(self, username: str) -> bool:
+        return self.shard_for(username).might_contain(username)  # the shard's own filter
+
+    def has_users(self) -> bool:
+        return any(shard.has_users() for shard in self.shards)
+
+    def count(self) -> int:
+        return sum(shard.count() for shard in self.shards)
+
+    def usernames(self) -> Iterator[str]:
+        for shard in self.shards:
+            yield from shard.usernames()
+
+    def items(self) -> Iterator[Record]:
+        for shard in self.shards:
+            yield from shard.items()
+
+    def add(self, username: str, password_hash: str, role: str = DEFAULT_ROLE) -> bool:
+        return self.shard_for(username).add(username, password_hash, role)
+
+    def add_many(self, records: Iterable[Record]) -> List[str]:
+        """Group records by shard and append each group under that shard's lock."""
+        groups: Dict[int, List[Record]] = {}
+        for record in records:
+            index = zlib.crc32(record[0].encode("utf-8")) % len(self.shards)
+            groups.setdefault(index, []).append(record)
+        added: List[str] = []
+        for index, group in groups.items():
+            added.extend(self.shards[index].add_many(group))
+        return added
+
+    def update_hash(self, username: str, password_hash: str, expected: Optional[str] = None) -> bool:
+        return self.shard_for(username).update_hash(username, password_hash, expected)
+
+    def update_many(self, updates: Iterable[Update]) -> List[str]:
+        """Group updates by shard and apply each group under that shard's lock."""
+        groups: Dict[int, List[Update]] = {}
+        for update in updates:
+            index = zlib.crc32(update[0].encode("utf-8")) % len(self.shards)
+            groups.setdefault(index, []).append(update)
+        updated: List[str] = []
+        for index, group in groups.items():
+            updated.extend(self.shards[index].update_many(group))
+        return updated
+
+    def delete(self, username: str) -> bool:
+        return self.shard_for(username).delete(username)
+
+
+class LogUserStore:
+    def __init__(self, path: str, dead_ratio: float = 0.5, min_records: int = 1000, background: bool = True,
+                 bloom: bool = False):
+        """
+        Store users as an append-only log of mutations with an in-memory index.
+
+        Each line is "C,username,hash,role" (create), "U,username,hash,role"
+        (update) or "D,username" (delete). The index keeps the latest live
+        record per user, so every mutation is one O(1) append. When dead lines
+        (superseded or deleted) pass `dead_ratio` of the log, it is compacted
+        into a fresh log of live creates, in a background thread by default.
+
+        Writers serialise on "<path>.lock" rather than the log itself, because
+        compaction swaps the log file out from under any lock held on it.
+
+        :param path: Path to the log file.
+        :param dead_ratio: Fraction of dead lines that triggers compaction.
+        :param min_records: Logs shorter than this are never compacted.
+        :param background: Compact in a daemon thread instead of inline.
+        :param bloom: Keep a UsernameFilter in "<path>.bloom" for might_contain().
+        """
+        self.path = path
+        self.location = path
+        self.lock_path = path + ".lock"
+        self.dead_ratio = dead_ratio
+        self.min_records = min_records
+        self.background = background
+        self._index: Dict[str, Tuple[str, str]] = {}
+        self._records = 0
+        self._stamp: Optional[Tuple[int, int]] = None  # (inode, bytes applied)
+        self._mutex = threading.RLock()
+        self._compactor: Optional[threading.Thread] = None
+        self._filter = UsernameFilter(path + ".bloom") if bloom else None
+
+    # -- log replay -----------------------------------------------------------
+
+    def _apply(self, line: str) -> None:
+        parts = line.rstrip("\n").split(",")
+        if len(parts) < 2:
+            return
+        op, username = parts[0], parts[1]
+        self._records += 1
+        if op == "D":
+            self._index.pop(username, None)
+        elif len(parts) >= 3:
+            role = parts[3] if len(parts) > 3 and parts[3] else DEFAULT_ROLE
+            self._index[username] = (parts[2], role)
+
+    def _sync(self) -> None:
+        """Apply lines appended since the last sync; replay fully after a compaction."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._index, self._records, self._stamp = {}, 0, None
+            return
+        if self._stamp == (st.st_ino, st.st_size):
+            return
+        with open(self.path, "rb") as f:
+            fst = os.fstat(f.fileno())
+            start = 0
+            if self._stamp and self._stamp[0] == fst.st_ino and self._stamp[1] <= fst.st_size:
+                start = self._stamp[1]
+            else:
+                self._index, self._records = {}, 0
+            f.seek(start)
+            chunk = f.read()
+        # Ignore a trailing partial line from a writer that is mid-append
+        complete = chunk[:chunk.rfind(b"\n") + 1]
+        for line in complete.decode("utf-8").splitlines():
+            self._apply(line)
+        self._stamp = (fst.st_ino, start + len(complete))
+
+    @contextmanager
+    def _locked(self) -> Generator[None, None, None]:
+        with self._mutex, open(self.lock_path, "a") as lock:
+            _lock_file(lock)
+            try:
+                self._sync()
+                yield
+            finally:
+                _unlock_file(lock)
+
+    def _append(self, lines: List[str]) -> None:
+        # Caller holds _locked(), so the log ends exactly at our stamp.
+        if not lines:
+            return
+        with open(self.path, "ab") as f:
+            f.write("".join(lines).encode("utf-8"))
+            f.flush()
+            st = os.fstat(f.fileno())
+        for line in lines:
+            self._apply(line)
+        self._stamp = (st.st_ino, st.st_size)
+        self._maybe_compact()
+
+    # -- lookups --------------------------------------------------------------
+
+    def get_hash(self, username: str) -> Optional[str]:
+        with self._mutex:
+            self._sync()
+            entry = self._index.get(username)
+        return entry[0] if entry else None
+
+    def exists(self, username: str) -> bool:
+        return self.get_hash(username) is not None
+
+    def stamp(self) -> Optional[Tuple[int, int, int]]:
+        return _file_stamp(self.path)
+
+    def might_contain(self, username: str) -> bool:
+        return self._filter is None or self._filter.might_contain(username, self)
+
+    def has_users(self) -> bool:
+        return self.count() > 0
+
+    def count(self) -> int:
+        with self._mutex:
+            self._sync()
+            return len(self._index)
+
+    def usernames(self) -> Iterator[str]:
+        with self._mutex:
+            self._sync()
+            names = list(self._index)
+        return iter(names)
+
+    def items(self) -> Iterator[Record]:
+        with self._mutex:
+            self._sync()
+            snapshot = list(self._index.items())
+        for username, (password_hash, role) in snapshot:
+            yield username, password_hash, role
+
+    # -- mutations ------------------------------------------------------------
+
+    def add(self, username: str, password_hash: str, role: str = DEFAULT_ROLE) -> bool:
+        return bool(self.add_many([(username, password_hash, role)]))
+
+    def add_many(self, records: Iterable[Record]) -> List[str]:
+        records = _validated(records)
+        with self._locked(), _noting(self._filter, self) as added:
+            lines: List[str] = []
+            pending = set()
+            for username, password_hash, role in records:
+                if username in self._index or username in pending:
+                    continue
+                pending.add(username)
+                added.append(username)
+                lines.append(f"C,{username},{password_hash},{role}\n")
+            self._append(lines)
+            return added
+
+    def update_hash(self, username: str, password_hash: str, expected: Optional[str] = None) -> bool:
+        return bool(self.update_many([(username, password_hash, expected)]))
+
+    def update_many(self, updates: Iterable[Update]) -> List[str]:
+        with self._locked(), _noting(self._filter, self):
+            updated: List[str] = []
+            lines: List[str] = []
+            pending: Dict[str, Tuple[str, str]] = {}
+            for username, password_hash, expected in updates:
+                _check_hash(username, password_hash)
+                entry = pending.get(username) or self._index.get(username)
+                if entry is None or (expected is not None and entry[0] != expected):
+                    continue
+                pending[username] = (password_hash, entry[1])
+                updated.append(username)
+                lines.append(f"U,{username},{password_hash},{entry[1]}\n")
+            self._append(lines)
+            return updated
+
+    def delete(self, username: str) -> bool:
+        with self._locked(), _noting(self._filter, self):
+            if username not in self._index:
+                return False
+            self._append([f"D,{username}\n"])
+            return True
+
+    # -- compaction -----------------------------------------------------------
+
+    def dead_records(self) -> int:
+        return self._records - len(self._index)
+
+    def _maybe_compact(self) -> None:
+        if self._records < self.min_records or self.dead_records() < self.dead_ratio * self._records:
+            return
+        if not self.background:
+            self._compact_locked()  # _append runs under _locked(); re-locking would deadlock
+        elif self._compactor is None or not self._compactor.is_alive():
+            self._compactor = threading.Thread(target=self.compact, name="user-log-compactor", daemon=True)
+            self._compactor.start()
+
+    def compact(self) -> int:
+        """Rewrite the log as one create per live user; returns the live count."""
+        with self._locked(), _noting(self._filter, self):
+            return self._compact_locked()
+
+    def _compact_locked(self) -> int:
+        # Caller holds _locked(): flock conflicts across fds even in one process.
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "wb") as out:
+            for username, (password_hash, role) in self._index.items():
+                out.write(f"C,{username},{password_hash},{role}\n".encode("utf-8"))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.path)
+        st = os.stat(self.path)
+        self._records = len(self._index)
+        self._stamp = (st.st_ino, st.st_size)
+        return self._records
+
+
+def migrate_users_file(src_path: str, store, batch_size: int = 1000) -> int:
+    """
+    Copy the users in a users.txt file into another store in batches.
+
+    Existing usernames in the destination are kept, so the migration can be re-run.
+
+    :return: Number of users added to `store`.
+    """
+    migrated = 0
+    batch: List[Record] = []
+    # Read through FileUserStore so a superseding line wins over the original
+    for record in FileUserStore(src_path).items():
+        batch.append(record)
+        if len(batch) >= batch_size:
+            migrated += len(store.add_many(batch))
+            batch.clear()
+    if batch:
+        migrated += len(store.add_many(batch))
+    return migrated
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Migrate users.txt into another user store.")
+    parser.add_argument("src", nargs="?", default="users.txt")
+    parser.add_argument("dest", nargs="?", default="DATA/intelligence_platform.db")
+    parser.add_argument("--backend", choices=["sqlite", "mmap", "sharded", "log"], default="sqlite")
+    parser.add_argument("--shards", type=int, default=16, help="shard count for --backend sharded")
+    args = parser.parse_args()
+    if args.backend == "log":
+        count = migrate_users_file(args.src, LogUserStore(args.dest))
+    elif args.backend == "sharded":
+        count = migrate_users_file(args.src, ShardedUserStore(args.dest, args.shards))
+    elif args.backend == "mmap":
+        store = MmapUserStore(args.dest)
+        count = migrate_users_file(args.src, store)
+        store.compact()
+    else:
+        count = migrate_users_file(args.src, SqliteUserStore(args.dest))
+    print(f"Migrated {count} users from {args.src} into {args.dest}")